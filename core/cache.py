@@ -2,126 +2,621 @@
 core/cache.py - Memory management and caching
 """
 
+import os
+import sys
+import json
+import time
+import pickle
+import sqlite3
+import io
 import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional, Any, Tuple
+from typing import Dict, Optional, Any, Tuple, Union, Iterable, Callable, Sequence
 import numpy as np
 
+PathKey = Union[str, Path]
+
+def _file_signature(path: PathKey) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of a file, or None if it cannot be stat'ed"""
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+# A hash -> offset dict, or parallel (sorted uint64 hashes, int32 offsets) arrays
+Fingerprint = Union[Dict[str, int], Tuple[np.ndarray, np.ndarray]]
+
+def _pack_fingerprint(fingerprint: Fingerprint) -> bytes:
+    """Fingerprint as two .npy arrays, far smaller than pickle"""
+    buf = io.BytesIO()
+    if isinstance(fingerprint, tuple):
+        hashes, offsets = fingerprint
+        np.save(buf, np.asarray(hashes, dtype=np.uint64), allow_pickle=False)
+        np.save(buf, np.asarray(offsets, dtype=np.int32), allow_pickle=False)
+    else:
+        np.save(buf, np.array(list(fingerprint), dtype='S20'), allow_pickle=False)
+        np.save(buf, np.fromiter(fingerprint.values(), dtype=np.int32, count=len(fingerprint)), allow_pickle=False)
+    return buf.getvalue()
+
+def _unpack_fingerprint(data: bytes) -> Fingerprint:
+    buf = io.BytesIO(data)
+    hashes = np.load(buf, allow_pickle=False)
+    offsets = np.load(buf, allow_pickle=False)
+    # Byte-string hashes are dict keys; integer hashes were stored as arrays
+    if hashes.dtype.kind != 'S': return hashes, offsets
+    return dict(zip(np.char.decode(hashes, 'ascii').tolist(), offsets.tolist()))
+
+class _DiskStore:
+    """SQLite tier for small cache values, invalidated by file mtime and size"""
+
+    TABLES = ('duration', 'stream_info', 'stream_index', 'chromaprint', 'fingerprint', 'mfcc', 'scenes')
+    # Tables pruned oldest-first once the byte limit is exceeded
+    BULK_TABLES = ('chromaprint', 'fingerprint')
+
+    def __init__(self, db_path: Path, ttl_days: float = 30, byte_limit: int = 256 * 1024 * 1024,
+                 read_only: bool = False):
+        self._lock = threading.Lock()
+        self.read_only = read_only
+        if read_only:
+            # Fingerprint worker processes only read; the parent owns every write and the pruning
+            self._conn = sqlite3.connect(f'{Path(db_path).resolve().as_uri()}?mode=ro', uri=True, check_same_thread=False)
+            for pragma in ('temp_store=MEMORY', 'cache_size=-16000', 'mmap_size=268435456'):
+                self._conn.execute(f'PRAGMA {pragma}')
+            return
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        # Per-connection tuning; WAL lets fingerprint workers read while another thread commits.
+        # Shared-cache mode is deliberately left off (deprecated, and slower under WAL).
+        for pragma in ('journal_mode=WAL', 'synchronous=NORMAL', 'temp_store=MEMORY',
+                       'cache_size=-16000', 'mmap_size=268435456'):
+            self._conn.execute(f'PRAGMA {pragma}')
+        for table in self.TABLES:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                'path TEXT, mtime INTEGER, size INTEGER, stream INTEGER, value, created REAL, '
+                'PRIMARY KEY (path, mtime, size, stream))'
+            )
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_identity ON {table} (mtime, size, stream)')
+        self._prune(ttl_days, byte_limit)
+        self._conn.commit()
+
+    def _prune(self, ttl_days: float, byte_limit: int):
+        """Drop rows older than the TTL, then the oldest rows past the byte limit"""
+        cutoff = time.time() - ttl_days * 86400
+        for table in self.TABLES:
+            self._conn.execute(f'DELETE FROM {table} WHERE created < ?', (cutoff,))
+
+        total = sum(
+            self._conn.execute(f'SELECT COALESCE(SUM(LENGTH(value)), 0) FROM {table}').fetchone()[0]
+            for table in self.TABLES
+        )
+        if total <= byte_limit: return
+        union = ' UNION ALL '.join(f'SELECT created, LENGTH(value) AS length FROM {t}' for t in self.BULK_TABLES)
+        rows = self._conn.execute(f'SELECT created, length FROM ({union}) ORDER BY created').fetchall()
+        for created, length in rows:
+            if total <= byte_limit: break
+            total -= length or 0
+            cutoff = created
+        for table in self.BULK_TABLES:
+            self._conn.execute(f'DELETE FROM {table} WHERE created <= ?', (cutoff,))
+
+    def get(self, table: str, path: str, stream: Union[int, str] = -1) -> Optional[Any]:
+        sig = _file_signature(path)
+        if sig is None: return None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    f'SELECT value FROM {table} WHERE path = ? AND mtime = ? AND size = ? AND stream = ?',
+                    (path, sig[0], sig[1], stream)
+                ).fetchone()
+                if row is None:
+                    # A renamed or moved file keeps its mtime and size; reuse its row if exactly one matches
+                    rows = self._conn.execute(
+                        f'SELECT value, created, path FROM {table} WHERE mtime = ? AND size = ? AND stream = ? LIMIT 2',
+                        (sig[0], sig[1], stream)
+                    ).fetchall()
+                    if len(rows) != 1: return None
+                    row = rows[0]
+                    if self.read_only: return row[0]
+                    self._conn.execute(f'DELETE FROM {table} WHERE path = ? AND stream = ?', (path, stream))
+                    if os.path.exists(row[2]):
+                        # Still present under the old name (a copy): keep both rows
+                        self._conn.execute(
+                            f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)',
+                            (path, sig[0], sig[1], stream, row[0], row[1])
+                        )
+                    else:
+                        self._conn.execute(
+                            f'UPDATE {table} SET path = ? WHERE path = ? AND stream = ?', (path, row[2], stream)
+                        )
+                    self._conn.commit()
+        except sqlite3.Error:
+            return None
+        return row[0]
+
+    # Four bound parameters per key; stays under SQLite's default 999-variable limit
+    BULK_CHUNK = 200
+
+    def get_many(self, table: str, keys: Iterable[Tuple[str, Union[int, str]]]) -> Dict[Tuple[str, Union[int, str]], Any]:
+        """Values for many (path, stream) keys, one query per chunk instead of one per key"""
+        params = []
+        for path, stream in keys:
+            sig = _file_signature(path)
+            if sig is not None: params.append((path, sig[0], sig[1], stream))
+        found = {}
+        try:
+            with self._lock:
+                for start in range(0, len(params), self.BULK_CHUNK):
+                    chunk = params[start:start + self.BULK_CHUNK]
+                    values = ', '.join(['(?, ?, ?, ?)'] * len(chunk))
+                    rows = self._conn.execute(
+                        f'WITH k(path, mtime, size, stream) AS (VALUES {values}) '
+                        f'SELECT t.path, t.stream, t.value FROM {table} t JOIN k USING (path, mtime, size, stream)',
+                        [v for key in chunk for v in key]
+                    ).fetchall()
+                    found.update(((path, stream), value) for path, stream, value in rows)
+        except sqlite3.Error:
+            pass
+        return found
+
+    def set(self, table: str, path: str, value: Any, stream: Union[int, str] = -1):
+        if self.read_only: return
+        sig = _file_signature(path)
+        if sig is None: return
+        try:
+            with self._lock:
+                # Rows for older versions of the file can never match again
+                self._conn.execute(f'DELETE FROM {table} WHERE path = ? AND stream = ?', (path, stream))
+                self._conn.execute(
+                    f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)',
+                    (path, sig[0], sig[1], stream, value, time.time())
+                )
+                self._conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        if self.read_only: return
+        try:
+            with self._lock:
+                for table in self.TABLES:
+                    self._conn.execute(f'DELETE FROM {table}')
+                self._conn.commit()
+        except sqlite3.Error:
+            pass
+
 class MediaCache:
     """Centralized cache for media data to avoid re-processing"""
 
-    def __init__(self, max_audio_mb: int = 500):
-        self._lock = threading.RLock()
+    def __init__(self, max_audio_mb: int = 500, max_entries: int = 2048, audio_shards: Optional[int] = None,
+                 db_path: Optional[Path] = None, db_ttl_days: float = 30, db_byte_limit_mb: int = 256,
+                 db_read_only: bool = False, max_scores: int = 65536):
         self.max_audio_bytes = max_audio_mb * 1024 * 1024
+        self.max_entries = max_entries
+        self.max_scores = max_scores
+
+        # Durations, stream info and fingerprints also persist across runs
+        self.db_path = db_path
+        self._disk: Optional[_DiskStore] = None
+        if db_path is not None:
+            try:
+                self._disk = _DiskStore(db_path, db_ttl_days, db_byte_limit_mb * 1024 * 1024, db_read_only)
+            except sqlite3.Error:
+                self._disk = None
+
+        # Read-mostly caches are copy-on-write: readers never lock, writers
+        # rebind a fresh dict under the cache's lock
+        self._duration_cache: Dict[str, float] = {}
+        self._duration_lock = threading.Lock()
+        self._stream_info_cache: Dict[str, list] = {}
+        self._stream_info_lock = threading.Lock()
+        self._stream_choice_cache: Dict[Tuple[str, str], int] = {}
+        self._stream_choice_lock = threading.Lock()
 
-        # Caches
-        self._duration_cache: Dict[Path, float] = {}
-        self._stream_info_cache: Dict[Path, list] = {}
-        self._audio_cache: Dict[Tuple[Path, int, int], np.ndarray] = {}
-        self._audio_cache_size = 0
+        # Audio is sharded so concurrent matchers rarely contend on the same lock
+        n_shards = audio_shards or 4 * (os.cpu_count() or 1)
+        self._audio_shards = [OrderedDict() for _ in range(n_shards)]
+        self._audio_locks = [threading.Lock() for _ in range(n_shards)]
+        self._audio_size = 0
+        self._audio_size_lock = threading.Lock()
+        # Evicted buffers stay reachable here for as long as a matcher still holds them
+        self._audio_weak: 'weakref.WeakValueDictionary[Tuple[str, int, int], np.ndarray]' = weakref.WeakValueDictionary()
+        self._audio_weak_lock = threading.Lock()
 
         # Video caches
-        self._video_hash_cache: Dict[Tuple[Path, str], Any] = {}
-        self._scene_cache: Dict[Path, list] = {}
+        self._video_hash_cache: 'OrderedDict[Tuple[str, str], Any]' = OrderedDict()
+        self._video_hash_lock = threading.Lock()
+        self._scene_cache: Dict[str, np.ndarray] = {}
+        self._scene_lock = threading.Lock()
 
         # Audio fingerprint caches
-        self._chromaprint_cache: Dict[Tuple[Path, int], str] = {}
-        self._mfcc_cache: Dict[Tuple[Path, int], np.ndarray] = {}
+        self._chromaprint_cache: Dict[Tuple[str, int], np.ndarray] = {}
+        self._chromaprint_lock = threading.Lock()
+        self._mfcc_cache: 'OrderedDict[Tuple[str, int], np.ndarray]' = OrderedDict()
+        self._mfcc_lock = threading.Lock()
+        self._fingerprint_cache: 'OrderedDict[Tuple[str, str, str], Any]' = OrderedDict()
+        self._fingerprint_lock = threading.Lock()
+
+        # Pairwise compare results keyed by (ref, remux, mode, language)
+        self._score_cache: Dict[Tuple[str, str, str, str], Tuple[float, str]] = {}
+        self._score_lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: PathKey) -> str:
+        """Canonical interned string key, cheaper to hash and compare than Path"""
+        return sys.intern(str(path))
 
     def clear(self):
         """Clear all caches"""
-        with self._lock:
-            self._duration_cache.clear()
-            self._stream_info_cache.clear()
-            self._audio_cache.clear()
-            self._audio_cache_size = 0
+        with self._duration_lock:
+            self._duration_cache = {}
+        with self._stream_info_lock:
+            self._stream_info_cache = {}
+        with self._stream_choice_lock:
+            self._stream_choice_cache = {}
+        for shard, lock in zip(self._audio_shards, self._audio_locks):
+            with lock:
+                freed = sum(a.nbytes for a in shard.values())
+                shard.clear()
+            self._add_audio_size(-freed)
+        with self._audio_weak_lock:
+            self._audio_weak.clear()
+        with self._video_hash_lock:
             self._video_hash_cache.clear()
-            self._scene_cache.clear()
-            self._chromaprint_cache.clear()
+        with self._scene_lock:
+            self._scene_cache = {}
+        with self._chromaprint_lock:
+            self._chromaprint_cache = {}
+        with self._mfcc_lock:
             self._mfcc_cache.clear()
+        with self._fingerprint_lock:
+            self._fingerprint_cache.clear()
+        with self._score_lock:
+            self._score_cache = {}
+        if self._disk:
+            self._disk.clear()
 
-    def get_duration(self, path: Path) -> Optional[float]:
+    def get_duration(self, path: PathKey) -> Optional[float]:
         """Get cached duration or None"""
-        return self._duration_cache.get(path)
+        key = self._key(path)
+        duration = self._duration_cache.get(key)
+        if duration is None and self._disk:
+            duration = self._disk.get('duration', key)
+            if duration is not None:
+                self._cow_set('_duration_cache', self._duration_lock, key, duration)
+        return duration
 
-    def set_duration(self, path: Path, duration: float):
+    def set_duration(self, path: PathKey, duration: float):
         """Cache duration"""
-        with self._lock:
-            self._duration_cache[path] = duration
+        key = self._key(path)
+        self._cow_set('_duration_cache', self._duration_lock, key, duration)
+        if self._disk:
+            self._disk.set('duration', key, duration)
 
-    def get_stream_info(self, path: Path) -> Optional[list]:
+    def get_stream_info(self, path: PathKey) -> Optional[list]:
         """Get cached stream info or None"""
-        return self._stream_info_cache.get(path)
+        key = self._key(path)
+        info = self._stream_info_cache.get(key)
+        if info is None and self._disk:
+            stored = self._disk.get('stream_info', key)
+            if stored is not None:
+                info = json.loads(stored)
+                self._cow_set('_stream_info_cache', self._stream_info_lock, key, info)
+        return info
 
-    def set_stream_info(self, path: Path, info: list):
+    def set_stream_info(self, path: PathKey, info: list):
         """Cache stream info"""
-        with self._lock:
-            self._stream_info_cache[path] = info
+        key = self._key(path)
+        self._cow_set('_stream_info_cache', self._stream_info_lock, key, info)
+        # A failed probe is only remembered for this session
+        if self._disk and info:
+            self._disk.set('stream_info', key, json.dumps(info))
+
+    def get_stream_choice(self, path: PathKey, language: Optional[str]) -> Optional[int]:
+        """Get the cached audio stream index picked for a language"""
+        key = (self._key(path), language or '')
+        stream_idx = self._stream_choice_cache.get(key)
+        if stream_idx is None and self._disk:
+            stream_idx = self._disk.get('stream_index', key[0], key[1])
+            if stream_idx is not None:
+                self._cow_set('_stream_choice_cache', self._stream_choice_lock, key, stream_idx)
+        return stream_idx
+
+    def set_stream_choice(self, path: PathKey, language: Optional[str], stream_idx: int):
+        """Cache the audio stream index picked for a language"""
+        key = (self._key(path), language or '')
+        self._cow_set('_stream_choice_cache', self._stream_choice_lock, key, stream_idx)
+        if self._disk:
+            self._disk.set('stream_index', key[0], stream_idx, key[1])
+
+    def prewarm_stream_info(self, paths: Iterable[PathKey], probe: Callable[[Path], list], max_workers: int = 8):
+        """Probe every uncached path in parallel so matchers find stream info ready"""
+        missing = [Path(p) for p in dict.fromkeys(self._key(p) for p in paths) if self.get_stream_info(p) is None]
+        if not missing: return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe") as pool:
+            for path, info in zip(missing, pool.map(probe, missing)):
+                self.set_stream_info(path, info)
+
+    def prewarm_durations(self, paths: Iterable[PathKey], probe: Callable[[Path], Optional[float]], max_workers: int = 8):
+        """Probe every uncached duration in parallel so duration filters have data to work with"""
+        missing = [Path(p) for p in dict.fromkeys(self._key(p) for p in paths) if self.get_duration(p) is None]
+        if not missing: return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe") as pool:
+            for path, duration in zip(missing, pool.map(probe, missing)):
+                if duration: self.set_duration(path, duration)
+
+    def prewarm_probe(self, paths: Iterable[PathKey], probe: Callable[[Path], Tuple[list, Optional[float]]], max_workers: int = 8):
+        """Like prewarm_stream_info plus prewarm_durations, with one probe per file filling both"""
+        missing = [Path(p) for p in dict.fromkeys(self._key(p) for p in paths)
+                   if self.get_stream_info(p) is None or self.get_duration(p) is None]
+        if not missing: return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe") as pool:
+            for path, (info, duration) in zip(missing, pool.map(probe, missing)):
+                self.set_stream_info(path, info)
+                if duration: self.set_duration(path, duration)
+
+    def _cow_set(self, attr: str, lock: threading.Lock, key, value, max_entries: Optional[int] = None):
+        """Publish a copy of a read-mostly cache with one entry added"""
+        self._cow_update(attr, lock, {key: value}, max_entries)
+
+    def _cow_update(self, attr: str, lock: threading.Lock, items: Dict, max_entries: Optional[int] = None):
+        """Publish a copy of a read-mostly cache with several entries added in one copy"""
+        with lock:
+            new = getattr(self, attr).copy()
+            new.update(items)
+            if max_entries is not None:
+                while len(new) > max_entries:
+                    del new[next(iter(new))]
+            setattr(self, attr, new)
 
-    def get_audio(self, path: Path, stream_idx: int, sample_rate: int) -> Optional[np.ndarray]:
+    def _lru_get(self, cache: OrderedDict, lock: threading.Lock, key) -> Optional[Any]:
+        """Look up an LRU entry and mark it as most recently used"""
+        with lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def _lru_set(self, cache: OrderedDict, lock: threading.Lock, key, value):
+        """Insert an LRU entry, dropping the least recently used past max_entries"""
+        with lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+
+    def _audio_shard(self, key) -> int:
+        return hash(key) % len(self._audio_shards)
+
+    def get_audio(self, path: PathKey, stream_idx: int, sample_rate: int) -> Optional[np.ndarray]:
         """Get cached audio or None"""
-        key = (path, stream_idx, sample_rate)
-        return self._audio_cache.get(key)
-
-    def set_audio(self, path: Path, stream_idx: int, sample_rate: int, audio: np.ndarray):
-        """Cache audio with memory management"""
-        with self._lock:
-            key = (path, stream_idx, sample_rate)
-
-            # Check if we need to evict old entries
-            audio_bytes = audio.nbytes
-            if self._audio_cache_size + audio_bytes > self.max_audio_bytes:
-                self._evict_audio(audio_bytes)
-
-            self._audio_cache[key] = audio
-            self._audio_cache_size += audio_bytes
-
-    def _evict_audio(self, needed_bytes: int):
-        """Evict oldest audio entries to make room"""
-        # Simple FIFO eviction
-        while self._audio_cache and self._audio_cache_size + needed_bytes > self.max_audio_bytes:
-            key = next(iter(self._audio_cache))
-            audio = self._audio_cache.pop(key)
-            self._audio_cache_size -= audio.nbytes
-
-    def get_video_hashes(self, path: Path, method: str) -> Optional[Any]:
+        key = (self._key(path), stream_idx, sample_rate)
+        shard_idx = self._audio_shard(key)
+        audio = self._lru_get(self._audio_shards[shard_idx], self._audio_locks[shard_idx], key)
+        if audio is None:
+            with self._audio_weak_lock:
+                audio = self._audio_weak.get(key)
+            if audio is not None:
+                self.set_audio(path, stream_idx, sample_rate, audio)
+        return audio
+
+    def set_audio(self, path: PathKey, stream_idx: int, sample_rate: int, audio: np.ndarray) -> np.ndarray:
+        """Cache audio as float32 with memory management; returns the cached array"""
+        audio = np.asarray(audio, dtype=np.float32)
+        key = (self._key(path), stream_idx, sample_rate)
+        shard_idx = self._audio_shard(key)
+        shard = self._audio_shards[shard_idx]
+        audio_bytes = audio.nbytes
+
+        # Evicted buffers are only dereferenced after the locks are released
+        to_free = []
+        with self._audio_locks[shard_idx]:
+            old = shard.pop(key, None)
+            if old is not None:
+                audio_bytes -= old.nbytes
+                to_free.append(old)
+            shard[key] = audio
+        total = self._add_audio_size(audio_bytes)
+
+        # Check if we need to evict old entries
+        if total > self.max_audio_bytes:
+            evicted = self._evict_audio(shard_idx, key)
+            with self._audio_weak_lock:
+                for evicted_key, evicted_audio in evicted:
+                    self._audio_weak[evicted_key] = evicted_audio
+            to_free.extend(evicted)
+        del to_free
+        return audio
+
+    def _add_audio_size(self, delta: int) -> int:
+        with self._audio_size_lock:
+            self._audio_size += delta
+            return self._audio_size
+
+    def _evict_audio(self, start_shard: int, keep_key) -> list:
+        """Evict least recently used (key, audio) entries, one shard lock at a time"""
+        evicted = []
+        n_shards = len(self._audio_shards)
+        for offset in range(1, n_shards + 1):
+            shard_idx = (start_shard + offset) % n_shards
+            shard = self._audio_shards[shard_idx]
+            with self._audio_locks[shard_idx]:
+                while shard and self._audio_size > self.max_audio_bytes:
+                    key = next(iter(shard))
+                    if key == keep_key: break
+                    audio = shard.pop(key)
+                    self._add_audio_size(-audio.nbytes)
+                    evicted.append((key, audio))
+            if self._audio_size <= self.max_audio_bytes: break
+        return evicted
+
+    def get_video_hashes(self, path: PathKey, method: str) -> Optional[Any]:
         """Get cached video hashes"""
-        key = (path, method)
-        return self._video_hash_cache.get(key)
+        key = (self._key(path), method)
+        return self._lru_get(self._video_hash_cache, self._video_hash_lock, key)
 
-    def set_video_hashes(self, path: Path, method: str, hashes: Any):
+    def set_video_hashes(self, path: PathKey, method: str, hashes: Any):
         """Cache video hashes"""
-        with self._lock:
-            key = (path, method)
-            self._video_hash_cache[key] = hashes
-
-    def get_scenes(self, path: Path) -> Optional[list]:
-        """Get cached scene list"""
-        return self._scene_cache.get(path)
-
-    def set_scenes(self, path: Path, scenes: list):
-        """Cache scene list"""
-        with self._lock:
-            self._scene_cache[path] = scenes
-
-    def get_chromaprint(self, path: Path, stream_idx: int) -> Optional[str]:
-        """Get cached chromaprint fingerprint"""
-        key = (path, stream_idx)
-        return self._chromaprint_cache.get(key)
-
-    def set_chromaprint(self, path: Path, stream_idx: int, fingerprint: str):
-        """Cache chromaprint fingerprint"""
-        with self._lock:
-            key = (path, stream_idx)
-            self._chromaprint_cache[key] = fingerprint
-
-    def get_mfcc(self, path: Path, stream_idx: int) -> Optional[np.ndarray]:
-        """Get cached MFCC features"""
-        key = (path, stream_idx)
-        return self._mfcc_cache.get(key)
-
-    def set_mfcc(self, path: Path, stream_idx: int, features: np.ndarray):
+        key = (self._key(path), method)
+        self._lru_set(self._video_hash_cache, self._video_hash_lock, key, hashes)
+
+    def get_scenes(self, path: PathKey) -> Optional[np.ndarray]:
+        """Get cached scene durations as a read-only float32 vector"""
+        key = self._key(path)
+        scenes = self._scene_cache.get(key)
+        if scenes is None and self._disk:
+            stored = self._disk.get('scenes', key)
+            if stored is not None:
+                scenes = np.frombuffer(stored, dtype='<f4')
+                self._cow_set('_scene_cache', self._scene_lock, key, scenes, self.max_entries)
+        return scenes
+
+    def set_scenes(self, path: PathKey, scenes: Sequence[float]) -> np.ndarray:
+        """Cache scene durations, kept on disk too as detection costs a full decode; returns the cached vector"""
+        key = self._key(path)
+        packed = np.asarray(scenes, dtype='<f4').tobytes()
+        stored = np.frombuffer(packed, dtype='<f4')
+        self._cow_set('_scene_cache', self._scene_lock, key, stored, self.max_entries)
+        if self._disk:
+            self._disk.set('scenes', key, sqlite3.Binary(packed))
+        return stored
+
+    def get_chromaprint(self, path: PathKey, stream_idx: int) -> Optional[np.ndarray]:
+        """Get cached chromaprint fingerprint as a read-only uint32 array"""
+        key = (self._key(path), stream_idx)
+        fingerprint = self._chromaprint_cache.get(key)
+        if fingerprint is None and self._disk:
+            stored = self._disk.get('chromaprint', key[0], stream_idx)
+            if isinstance(stored, str):
+                # Rows written before fingerprints were packed hold CSV text
+                self.set_chromaprint(path, stream_idx, np.array(stored.split(','), dtype=np.int64).astype(np.uint32))
+                return self._chromaprint_cache.get(key)
+            if stored is not None:
+                fingerprint = np.frombuffer(stored, dtype='<u4')
+                self._cow_set('_chromaprint_cache', self._chromaprint_lock, key, fingerprint, self.max_entries)
+        return fingerprint
+
+    def get_chromaprints_bulk(self, keys: Iterable[Tuple[PathKey, int]]) -> Dict[Tuple[str, int], np.ndarray]:
+        """Cached chromaprints for many (path, stream_idx) keys, reading all disk misses in one pass"""
+        found, misses = {}, []
+        for path, stream_idx in keys:
+            key = (self._key(path), stream_idx)
+            fingerprint = self._chromaprint_cache.get(key)
+            if fingerprint is not None: found[key] = fingerprint
+            else: misses.append(key)
+        if not misses or not self._disk: return found
+        loaded = {}
+        for key, stored in self._disk.get_many('chromaprint', misses).items():
+            if isinstance(stored, str):
+                # Legacy CSV row: pack it and rewrite it in place
+                stored = np.array(stored.split(','), dtype=np.int64).astype('<u4').tobytes()
+                self._disk.set('chromaprint', key[0], sqlite3.Binary(stored), key[1])
+            loaded[key] = np.frombuffer(stored, dtype='<u4')
+        if loaded: self._cow_update('_chromaprint_cache', self._chromaprint_lock, loaded, self.max_entries)
+        found.update(loaded)
+        return found
+
+    def set_chromaprint(self, path: PathKey, stream_idx: int, fingerprint: np.ndarray):
+        """Cache chromaprint fingerprint (uint32 words, stored as packed little-endian bytes)"""
+        key = (self._key(path), stream_idx)
+        packed = np.ascontiguousarray(fingerprint, dtype='<u4').tobytes()
+        self._cow_set('_chromaprint_cache', self._chromaprint_lock, key, np.frombuffer(packed, dtype='<u4'), self.max_entries)
+        if self._disk:
+            self._disk.set('chromaprint', key[0], sqlite3.Binary(packed), stream_idx)
+
+    def get_mfcc(self, path: PathKey, stream_idx: int) -> Optional[np.ndarray]:
+        """Get cached MFCC features as a read-only float32 vector"""
+        key = (self._key(path), stream_idx)
+        features = self._lru_get(self._mfcc_cache, self._mfcc_lock, key)
+        if features is None and self._disk:
+            stored = self._disk.get('mfcc', key[0], stream_idx)
+            if stored is not None:
+                features = np.frombuffer(stored, dtype='<f4')
+                self._lru_set(self._mfcc_cache, self._mfcc_lock, key, features)
+        return features
+
+    def set_mfcc(self, path: PathKey, stream_idx: int, features: np.ndarray):
         """Cache MFCC features"""
-        with self._lock:
-            key = (path, stream_idx)
-            self._mfcc_cache[key] = features
+        key = (self._key(path), stream_idx)
+        self._lru_set(self._mfcc_cache, self._mfcc_lock, key, features)
+        if self._disk:
+            self._disk.set('mfcc', key[0], sqlite3.Binary(np.asarray(features, dtype='<f4').tobytes()), stream_idx)
+
+    def get_fingerprint(self, path: PathKey, mode: str, language: Optional[str]) -> Optional[Fingerprint]:
+        """Get a cached hash/offset fingerprint for a matcher mode and language"""
+        key = (self._key(path), mode, language or '')
+        fingerprint = self._lru_get(self._fingerprint_cache, self._fingerprint_lock, key)
+        if fingerprint is None and self._disk:
+            stored = self._disk.get('fingerprint', key[0], f'{mode}|{key[2]}')
+            if stored is not None:
+                fingerprint = _unpack_fingerprint(stored)
+                self._lru_set(self._fingerprint_cache, self._fingerprint_lock, key, fingerprint)
+        return fingerprint
+
+    def set_fingerprint(self, path: PathKey, mode: str, language: Optional[str], fingerprint: Fingerprint):
+        """Cache a hash/offset fingerprint for a matcher mode and language"""
+        key = (self._key(path), mode, language or '')
+        self._lru_set(self._fingerprint_cache, self._fingerprint_lock, key, fingerprint)
+        if self._disk:
+            self._disk.set('fingerprint', key[0], sqlite3.Binary(_pack_fingerprint(fingerprint)), f'{mode}|{key[2]}')
+
+    def get_content_fingerprint(self, digest: str, mode: str) -> Optional[Fingerprint]:
+        """Get a fingerprint computed this session from byte-identical decoded audio"""
+        return self._lru_get(self._fingerprint_cache, self._fingerprint_lock, (digest, mode, None))
+
+    def set_content_fingerprint(self, digest: str, mode: str, fingerprint: Fingerprint):
+        """Cache a fingerprint under its decoded audio's digest (memory only)"""
+        self._lru_set(self._fingerprint_cache, self._fingerprint_lock, (digest, mode, None), fingerprint)
+
+    def get_score(self, ref: str, remux: str, mode: str, language: str) -> Optional[Tuple[float, str]]:
+        """Get a cached (score, info) compare result"""
+        return self._score_cache.get((ref, remux, mode, language))
+
+    def set_score(self, ref: str, remux: str, mode: str, language: str, result: Tuple[float, str]):
+        """Cache a (score, info) compare result"""
+        self._cow_set('_score_cache', self._score_lock, (ref, remux, mode, language), result, self.max_scores)
+
+    def set_scores(self, results: Dict[Tuple[str, str, str, str], Tuple[float, str]]):
+        """Cache many {(ref, remux, mode, language): (score, info)} results in one copy"""
+        if results: self._cow_update('_score_cache', self._score_lock, results, self.max_scores)
+
+    @staticmethod
+    def _score_key_current(file_key: str, signatures: Dict[str, Optional[Tuple[int, int]]]) -> bool:
+        """Whether a 'path|mtime_ns|size' key still describes the file on disk"""
+        parts = file_key.rsplit('|', 2)
+        if len(parts) != 3 or not (parts[1].isdigit() and parts[2].isdigit()): return False
+        path, mtime, size = parts
+        if path not in signatures: signatures[path] = _file_signature(path)
+        return signatures[path] == (int(mtime), int(size))
+
+    def load_scores(self, file_path: Path):
+        """Merge compare results saved by a previous session, dropping those for changed or deleted files"""
+        try:
+            with open(file_path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if not isinstance(saved, dict): return
+        signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        current = {key: result for key, result in saved.items()
+                   if self._score_key_current(key[0], signatures) and self._score_key_current(key[1], signatures)}
+        with self._score_lock:
+            merged = {**current, **self._score_cache}
+            # Oldest saved results go first once past the cap
+            for key in list(merged)[:max(0, len(merged) - self.max_scores)]:
+                del merged[key]
+            self._score_cache = merged
+
+    def save_scores(self, file_path: Path):
+        """Write compare results for reuse by later sessions"""
+        snapshot = self._score_cache
+        try:
+            tmp_path = Path(file_path).with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, file_path)
+        except OSError:
+            pass
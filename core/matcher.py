@@ -2,33 +2,58 @@
 core/matcher.py - Base matcher interface
 """
 
-from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Tuple, Optional
 
-class BaseMatcher(ABC):
+class BaseMatcher:
     """Base class for all matching implementations"""
 
+    __slots__ = ('cache', 'config', 'app_data_dir', '_running')
+    # True when get_fingerprint mostly waits on subprocesses or GIL-free native
+    # code, so the pipeline can fan it out over threads instead of processes
+    threaded_fingerprints = False
+    # Cache namespace for persisted fingerprints (defaults to the mode name);
+    # changing it when the fingerprint format changes orphans stale entries
+    fingerprint_key: Optional[str] = None
+    # Score-memo namespace (defaults to the mode name); include any setting the
+    # compare result depends on, so changing it does not reuse stale scores
+    score_key: Optional[str] = None
+
     def __init__(self, cache, config, app_data_dir: Path):
         self.cache = cache
         self.config = config
         self.app_data_dir = app_data_dir
         self._running = True
 
+    def start(self):
+        """Re-arm a stopped matcher for another run"""
+        self._running = True
+
     def stop(self):
         """Stop the matching process"""
         self._running = False
 
-    @abstractmethod
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         """
         Compare two files and return similarity score
         Returns: (confidence 0-1, info string)
         """
-        pass
+        raise NotImplementedError
+
+    def cheap_score(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> float:
+        """
+        Fast estimate of compare() used to shortlist candidates. May compute
+        data for ref_path but must only read already-cached data for
+        remux_path. Returns 0.0 when no estimate is available.
+        """
+        return 0.0
 
     def get_audio_stream_index(self, path: Path, language: Optional[str] = None) -> Optional[int]:
         """Helper to find the right audio stream, with clear logic and fallback."""
+        cached = self.cache.get_stream_choice(path, language)
+        if cached is not None:
+            return cached
+
         from utils.media import get_stream_info
 
         all_streams = self.cache.get_stream_info(path)
@@ -36,30 +61,23 @@ class BaseMatcher(ABC):
             all_streams = get_stream_info(path)
             self.cache.set_stream_info(path, all_streams)
 
-        if not all_streams:
-            return None
-
-        audio_streams = [
-            (i, s) for i, s in enumerate(all_streams) if s.get('codec_type') == 'audio'
-        ]
-
-        if not audio_streams:
-            return None
-
-        if not language:
-            return audio_streams[0][0]
-
-        candidates = []
-        for abs_index, stream in audio_streams:
-            stream_lang = stream.get('tags', {}).get('language', '').lower()
-            if stream_lang == language:
-                title = stream.get('tags', {}).get('title', '').lower()
-                is_non_commentary = 'commentary' not in title
-                candidates.append({'index': abs_index, 'non_comm': is_non_commentary})
-
-        if candidates:
-            candidates.sort(key=lambda x: x['non_comm'], reverse=True)
-            return candidates[0]['index']
+        # Single pass: prefer a non-commentary stream in the requested language,
+        # then any stream in that language, then the first audio stream.
+        first_audio, lang_match = None, None
+        for abs_index, stream in enumerate(all_streams or ()):
+            if stream.get('codec_type') != 'audio': continue
+            if first_audio is None:
+                first_audio = abs_index
+                if not language: break
+            tags = stream.get('tags', {})
+            if tags.get('language', '').lower() != language: continue
+            if 'commentary' not in tags.get('title', '').lower():
+                lang_match = abs_index
+                break
+            if lang_match is None:
+                lang_match = abs_index
 
-        # Fallback to the first audio stream if no language match is found
-        return audio_streams[0][0]
+        choice = lang_match if lang_match is not None else first_audio
+        if choice is not None:
+            self.cache.set_stream_choice(path, language, choice)
+        return choice
@@ -2,11 +2,102 @@
 core/pipeline.py - Main matching pipeline orchestrator
 """
 
+import os
+import json
+import time
+import heapq
+import hashlib
+import importlib
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Generator, Optional
+from typing import Any, List, Dict, Generator, Optional, Tuple
 from dataclasses import dataclass
+from types import MappingProxyType
+
+# Pairs whose durations differ by more than this are never compared
+DURATION_TOLERANCE_S = 5.0
+# Above this many (ref, remux) cells, fall back to greedy best-per-remux
+ASSIGNMENT_MAX_CELLS = 250_000
+# When a matcher provides cheap_score estimates, only this many remuxes per
+# reference go on to the full compare()
+CHEAP_TOP_K = 5
+# A pair scoring at least this is taken as settled: the remux is not compared
+# against later references, and the reference's remaining compares are cancelled
+SETTLED_SCORE = 0.99
+# Match results are forwarded in 'match_batch' events of this size (1 = one 'match' per result)
+MATCH_BATCH_SIZE = 16
+# Minimum seconds between forwarded progress events (the first and 100% always pass)
+PROGRESS_INTERVAL_S = 0.1
+
+AUDIO_MODES = {'correlation', 'cascade', 'chromaprint', 'peak_matcher', 'invariant_matcher', 'mfcc'}
+
+# mode -> (module, class); modules are imported on first use
+_MATCHER_REGISTRY = {
+    'correlation': ('matchers.audio.correlation', 'CorrelationMatcher'),
+    'chromaprint': ('matchers.audio.chromaprint', 'ChromaprintMatcher'),
+    'cascade': ('matchers.audio.cascade', 'CascadeMatcher'),
+    'peak_matcher': ('matchers.audio.peak_matcher', 'PeakMatcher'),
+    'invariant_matcher': ('matchers.audio.invariant_matcher', 'InvariantMatcher'),
+    'mfcc': ('matchers.audio.mfcc', 'MFCCMatcher'),
+    'phash': ('matchers.video.phash', 'PerceptualHashMatcher'),
+    'scene': ('matchers.video.scene', 'SceneDetectionMatcher'),
+}
+_MATCHER_CLASSES: Dict[str, type] = {}
+
+def _create_matcher(mode: str, cache, config, app_data_dir: Path):
+    entry = _MATCHER_REGISTRY.get(mode)
+    if not entry:
+        return None
+    cls = _MATCHER_CLASSES.get(mode)
+    if cls is None:
+        module_path, class_name = entry
+        cls = _MATCHER_CLASSES.setdefault(mode, getattr(importlib.import_module(module_path), class_name))
+    return cls(cache, config, app_data_dir)
+
+# Per-process matcher for fingerprint workers; matchers hold locks and DB
+# handles, so each worker builds its own instead of receiving a pickled one
+_worker_matcher = None
+
+def _settings_snapshot(config) -> Dict[str, Any]:
+    """Plain dict of a Config (or any mapping of settings), safe to pickle into workers"""
+    settings = getattr(config, 'settings', None)
+    return settings() if callable(settings) else dict(config)
+
+def _init_fp_worker(mode: str, settings: Dict[str, Any], app_data_dir: Path, db_path: Optional[Path]):
+    global _worker_matcher
+    from core.cache import MediaCache
+    # Matchers only read settings through .get, which the read-only view supports
+    config = MappingProxyType(settings)
+    # Read-only: N workers would otherwise prune the DB at once and race for its one writer
+    # lock; the parent persists what they return
+    _worker_matcher = _create_matcher(mode, MediaCache(db_path=db_path, db_read_only=True), config, app_data_dir)
+
+def _fp_worker(path: Path, language: Optional[str]):
+    return _worker_matcher.get_fingerprint(path, language)
+
+class _ProgressGate:
+    """
+    Decides whether an inner-loop progress event is worth building: only
+    when its value advanced and PROGRESS_INTERVAL_S has passed, the same
+    rule match() applies, so throttled iterations skip the message format.
+    """
+
+    __slots__ = ('last_value', 'last_time')
+
+    def __init__(self):
+        self.last_value = -1
+        self.last_time = 0.0
+
+    def __call__(self, value: int) -> bool:
+        if value <= self.last_value: return False
+        now = time.monotonic()
+        if now - self.last_time < PROGRESS_INTERVAL_S and value < 100: return False
+        self.last_value, self.last_time = value, now
+        return True
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MatchConfig:
     mode: str = "correlation"
     language: Optional[str] = None
@@ -24,6 +115,15 @@ class MatchingPipeline:
         self._threshold = 0.75
         self._running = False
         self._matcher = None
+        # One instance per mode, so matcher-held state survives between runs
+        self._matcher_cache: Dict[str, Any] = {}
+        self.match_batch_size = MATCH_BATCH_SIZE
+        # Compare thread pool, created per run so no threads outlive it
+        self._pool = None
+        self._pending = []
+        self._process_pool = None
+        self._score_file = self.app_data_dir / "score_cache.pkl"
+        self.cache.load_scores(self._score_file)
 
     def set_mode(self, mode: str):
         self._mode = mode
@@ -36,141 +136,436 @@ class MatchingPipeline:
 
     def stop(self):
         self._running = False
+        for future in self._pending:
+            future.cancel()
+        if self._process_pool:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
         if self._matcher:
             self._matcher.stop()
+        self.cache.save_scores(self._score_file)
 
     def match(self, references: List[Path], remuxes: List[Path]) -> Generator[Dict, None, None]:
+        """
+        Yields progress and match events. Matches are grouped into
+        'match_batch' events and progress is only forwarded when its value
+        advances, at most once per PROGRESS_INTERVAL_S, so GUI consumers
+        receive far fewer cross-thread signals. The latest throttled update
+        is still delivered when the run ends.
+        """
+        batch_size = self.match_batch_size
+        buffer = []
+        last_progress = -1
+        last_emit = 0.0
+        pending = None
+        for event in self._match(references, remuxes):
+            if event['type'] == 'match' and batch_size > 1:
+                buffer.append(event['data'])
+                if len(buffer) >= batch_size:
+                    yield {'type': 'match_batch', 'data': buffer}
+                    buffer = []
+                continue
+            if buffer:
+                yield {'type': 'match_batch', 'data': buffer}
+                buffer = []
+            if event['type'] == 'progress':
+                value = event['value']
+                final = value >= 100
+                now = time.monotonic()
+                if not final and (value <= last_progress or now - last_emit < PROGRESS_INTERVAL_S):
+                    pending = event
+                    continue
+                last_progress, last_emit, pending = value, now, None
+            yield event
+        if buffer:
+            yield {'type': 'match_batch', 'data': buffer}
+        if pending is not None:
+            yield pending
+
+    def _match(self, references: List[Path], remuxes: List[Path]) -> Generator[Dict, None, None]:
+        workers = self.config.get('match_workers', 0) or os.cpu_count() or 1
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compare")
+        try:
+            yield from self._run(references, remuxes)
+        finally:
+            # Also reached when the consumer stops iterating; queued compares are dropped
+            pool, self._pool = self._pool, None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, references: List[Path], remuxes: List[Path]) -> Generator[Dict, None, None]:
         self._running = True
         self._matcher = self._get_matcher()
         if not self._matcher:
             yield {'type': 'progress', 'message': 'Invalid matcher mode', 'value': 0}
             return
 
-        yield {'type': 'progress', 'message': f'Starting {self._mode} matching...', 'value': 0}
+        # Snapshot the settings so the whole run uses one consistent set
+        cfg = MatchConfig(self._mode, self._language, self._threshold)
+        yield {'type': 'progress', 'message': f'Starting {cfg.mode} matching...', 'value': 0}
+
+        from utils.media import get_media_duration, probe_media
+        # A format probe is cheap next to a decode, and feeds the duration filters; audio
+        # modes also need the streams, which the same ffprobe run returns
+        if cfg.mode in AUDIO_MODES:
+            self.cache.prewarm_probe([*references, *remuxes], probe_media)
+        else:
+            self.cache.prewarm_durations([*references, *remuxes], get_media_duration)
 
         audio_fingerprinters = ['chromaprint', 'peak_matcher', 'invariant_matcher']
-        if self._mode in audio_fingerprinters:
-            yield from self._run_fingerprint_batch(references, remuxes)
+        if cfg.mode in audio_fingerprinters:
+            yield from self._run_fingerprint_batch(references, remuxes, cfg)
         else:
-            yield from self._run_exhaustive_compare(references, remuxes)
+            # Matchers built on per-file fingerprints compute them all up front, in parallel
+            prefetch = getattr(self._matcher, 'prefetch', None)
+            if prefetch:
+                prefetch([*references, *remuxes], cfg.language, self.config.get('match_workers', 0) or None)
+            yield from self._run_exhaustive_compare(references, remuxes, cfg)
+            self.cache.save_scores(self._score_file)
 
         yield {'type': 'progress', 'message': 'Matching complete', 'value': 100}
 
-    def _run_fingerprint_batch(self, references: List[Path], remuxes: List[Path]):
+    def _run_fingerprint_batch(self, references: List[Path], remuxes: List[Path], cfg: MatchConfig):
         """Runs a fast, two-step process for fingerprinting matchers."""
-        total_files = len(references) + len(remuxes)
+        matcher, language, threshold = self._matcher, cfg.language, cfg.confidence_threshold
+
+        # Files whose duration rules out every counterpart are never decoded
+        compatible = self._compatibility_mask(self._durations(references), self._durations(remuxes))
+        usable_refs, usable_remuxes = compatible.any(axis=1), compatible.any(axis=0)
+
+        # A stable reference library's packed fingerprints are reused from disk
+        stackable = hasattr(matcher, 'stack_fingerprints')
+        ref_indices = np.flatnonzero(usable_refs)
+        ref_stack_base = self._ref_stack_base(cfg, [references[i] for i in ref_indices]) if stackable else None
+        ref_rows, ref_stack = self._load_ref_stack(ref_stack_base, references) if stackable else (None, None)
+
+        # (is_ref, index, path) for every usable file; fingerprints land in the matching dict
+        jobs = [] if ref_stack is not None else [(True, int(i), references[i]) for i in ref_indices]
+        jobs += [(False, j, p) for j, p in enumerate(remuxes) if usable_remuxes[j]]
+        ref_fingerprints, remux_fingerprints = {}, {}
+        total_files = len(jobs)
         files_done = 0
+        progress_due = _ProgressGate()
 
-        ref_fingerprints = {}
-        for ref_path in references:
-            if not self._running: return
-            files_done += 1
-            progress = int((files_done / total_files) * 50) if total_files > 0 else 0
-            yield {'type': 'progress', 'message': f'Analyzing ref: {ref_path.name}', 'value': progress}
-            fp = self._matcher.get_fingerprint(ref_path, self._language)
-            if fp: ref_fingerprints[ref_path] = fp
-
-        remux_fingerprints = {}
-        for remux_path in remuxes:
+        for is_ref, idx, path, fp in self._extract_fingerprints(jobs, cfg):
             if not self._running: return
             files_done += 1
             progress = int((files_done / total_files) * 50) if total_files > 0 else 0
-            yield {'type': 'progress', 'message': f'Analyzing remux: {remux_path.name}', 'value': progress}
-            fp = self._matcher.get_fingerprint(remux_path, self._language)
-            if fp: remux_fingerprints[remux_path] = fp
+            if progress_due(progress):
+                kind = 'ref' if is_ref else 'remux'
+                yield {'type': 'progress', 'message': f'Analyzing {kind}: {path.name}', 'value': progress}
+            if fp is not None and len(fp): (ref_fingerprints if is_ref else remux_fingerprints)[idx] = fp
+        if not self._running: return
 
         yield {'type': 'progress', 'message': 'Comparing fingerprints...', 'value': 50}
-        best_matches = {remux: {'score': -1, 'ref': None} for remux in remuxes}
-        used_references = set()
-
-        for remux_path, remux_fp in remux_fingerprints.items():
-            for ref_path, ref_fp in ref_fingerprints.items():
-                if not self._running: return
-                score = self._matcher.compare_fingerprints(ref_fp, remux_fp)
-                if score > best_matches[remux_path]['score']:
-                    best_matches[remux_path] = {'score': score, 'ref': ref_path}
-
-        for remux_path, match_info in best_matches.items():
-            best_ref = match_info['ref']
-            best_score = match_info['score']
-            if best_ref and best_score >= self._threshold:
-                used_references.add(best_ref)
-
-            info = f"{self._mode.replace('_', ' ').capitalize()} similarity: {best_score:.1%}" if best_score >= 0 else "Fingerprint failed"
+        scores = np.full((len(references), len(remuxes)), -1.0)
+
+        # Matchers with a contiguous fingerprint layout score the whole block at once
+        if stackable and ref_stack is None and ref_fingerprints:
+            ref_rows, ref_stack = self._stack_fingerprints(ref_fingerprints)
+            # Only a complete library is worth persisting; a failed file may succeed next time
+            if len(ref_rows) == len(ref_indices):
+                self._save_ref_stack(ref_stack_base, [references[i] for i in ref_rows], ref_stack)
+        if stackable:
+            if ref_rows and remux_fingerprints:
+                remux_cols, remux_stack = self._stack_fingerprints(remux_fingerprints)
+                scores[np.ix_(ref_rows, remux_cols)] = matcher.compare_stacked(ref_stack, remux_stack)
+        else:
+            for j, remux_fp in remux_fingerprints.items():
+                for i, ref_fp in ref_fingerprints.items():
+                    if not self._running: return
+                    scores[i, j] = matcher.compare_fingerprints(ref_fp, remux_fp)
+
+        best_refs = self._assign_references(scores)
+        best_scores = self._best_scores(scores, best_refs)
+        used = self._used_references(len(references), best_refs, best_scores, threshold)
+        for j, remux_path in enumerate(remuxes):
+            best_i = int(best_refs[j])
+            best_score = float(best_scores[j])
+            best_ref = references[best_i] if best_i >= 0 else None
+
+            if best_score >= 0:
+                info = f"{cfg.mode.replace('_', ' ').capitalize()} similarity: {best_score:.1%}"
+            else:
+                info = "Fingerprint failed" if usable_remuxes[j] else "No reference with a compatible duration"
             yield {'type': 'match', 'data': {'remux_path': str(remux_path), 'reference_path': str(best_ref) if best_ref else None, 'confidence': best_score, 'info': info}}
 
-        for ref_path in references:
-            if ref_path not in used_references:
+        for i, ref_path in enumerate(references):
+            if not used[i]:
                 yield {'type': 'match', 'data': {'remux_path': None, 'reference_path': str(ref_path), 'confidence': 0.0, 'info': 'Reference file not used', 'status': 'Unused'}}
 
-    def _run_exhaustive_compare(self, references: List[Path], remuxes: List[Path]):
+    def _run_exhaustive_compare(self, references: List[Path], remuxes: List[Path], cfg: MatchConfig):
         """Original exhaustive comparison for non-fingerprinting modes."""
-        best_matches = {remux: {'score': -1, 'ref': None, 'info': ''} for remux in remuxes}
-        used_references = set()
-        total_comparisons = len(references) * len(remuxes)
+        matcher, language, threshold = self._matcher, cfg.language, cfg.confidence_threshold
+        score_mode, score_language = getattr(matcher, 'score_key', None) or cfg.mode, language or ''
+        scores = np.full((len(references), len(remuxes)), -1.0)
+        infos = {}
+        ref_durations, remux_durations = self._durations(references), self._durations(remuxes)
+        compatible = self._compatibility_mask(ref_durations, remux_durations)
+        settled = bytearray(len(remuxes))
+        # Progress counts only the pairs that survive the duration filter
+        total_comparisons = int(compatible.sum())
         comparisons_done = 0
+        progress_due = _ProgressGate()
+        ref_keys = [self._file_key(p) for p in references]
+        remux_keys = [self._file_key(p) for p in remuxes]
 
-        for ref_path in references:
+        for i, ref_path in enumerate(references):
             if not self._running: break
-            for remux_path in remuxes:
+            candidates = []
+            row = np.flatnonzero(compatible[i])
+            row_end = comparisons_done + len(row)
+            for j in row:
+                if settled[j]: continue
+                cached = self.cache.get_score(ref_keys[i], remux_keys[j], score_mode, score_language)
+                if cached is None:
+                    candidates.append(int(j))
+                else:
+                    scores[i, j], infos[i, j] = cached
+                    if cached[0] >= SETTLED_SCORE: settled[j] = 1
+            candidates = self._shortlist(ref_path, remuxes, candidates, language)
+            if not candidates:
+                comparisons_done = row_end
+                continue
+            # Closest durations first: the likeliest match settles the row soonest
+            if ref_durations[i] > 0:
+                gaps = np.where(remux_durations > 0, np.abs(remux_durations - ref_durations[i]), np.inf)
+                candidates.sort(key=gaps.__getitem__)
+            comparisons_done += len(row) - len(candidates)
+
+            # Score the first pair inline so the reference's decoded data is
+            # cached before the workers fan out over the remaining remuxes
+            first = candidates[0]
+            result = matcher.compare(ref_path, remuxes[first], language)
+            scores[i, first], infos[i, first] = result
+            self.cache.set_score(ref_keys[i], remux_keys[first], score_mode, score_language, result)
+            comparisons_done += 1
+            progress = int((comparisons_done / total_comparisons) * 100) if total_comparisons > 0 else 0
+            if progress_due(progress):
+                yield {'type': 'progress', 'message': f'Comparing {ref_path.name} to {remuxes[first].name}', 'value': progress}
+            if result[0] >= SETTLED_SCORE:
+                settled[first] = 1
+                comparisons_done = row_end
+                continue
+
+            futures = {
+                self._pool.submit(matcher.compare, ref_path, remuxes[j], language): j
+                for j in candidates[1:]
+            }
+            self._pending = list(futures)
+            # Published to the score memo once per row rather than one dict copy per pair
+            row_results = {}
+            for future in as_completed(futures):
                 if not self._running: break
+                if future.cancelled(): continue
+                j = futures[future]
+                result = future.result()
+                scores[i, j], infos[i, j] = result
+                row_results[ref_keys[i], remux_keys[j], score_mode, score_language] = result
+                if result[0] >= SETTLED_SCORE:
+                    settled[j] = 1
+                    for pending in futures: pending.cancel()
 
                 comparisons_done += 1
                 progress = int((comparisons_done / total_comparisons) * 100) if total_comparisons > 0 else 0
-                yield {'type': 'progress', 'message': f'Comparing {ref_path.name} to {remux_path.name}', 'value': progress}
-
-                if not self._should_compare(ref_path, remux_path): continue
-
-                score, info = self._matcher.compare(ref_path, remux_path, self._language)
-
-                if score > best_matches[remux_path]['score']:
-                    best_matches[remux_path] = {'score': score, 'ref': ref_path, 'info': info}
+                if progress_due(progress):
+                    yield {'type': 'progress', 'message': f'Comparing {ref_path.name} to {remuxes[j].name}', 'value': progress}
+            self.cache.set_scores(row_results)
+            self._pending = []
+            comparisons_done = row_end
 
         if self._running:
-            for remux_path, match_info in best_matches.items():
-                best_ref = match_info['ref']
-                best_score = match_info['score']
-
-                if best_ref and best_score >= self._threshold:
-                    used_references.add(best_ref)
-
-                if best_ref and best_score >= 0:
-                    yield {'type': 'match', 'data': {'remux_path': str(remux_path), 'reference_path': str(best_ref), 'confidence': best_score, 'info': match_info['info']}}
+            best_refs = self._assign_references(scores)
+            best_scores = self._best_scores(scores, best_refs)
+            used = self._used_references(len(references), best_refs, best_scores, threshold)
+            for j, remux_path in enumerate(remuxes):
+                best_i = int(best_refs[j])
+                best_score = float(best_scores[j])
+
+                if best_i >= 0 and best_score >= 0:
+                    yield {'type': 'match', 'data': {'remux_path': str(remux_path), 'reference_path': str(references[best_i]), 'confidence': best_score, 'info': infos[best_i, j]}}
                 else:
                     yield {'type': 'match', 'data': {'remux_path': str(remux_path), 'reference_path': None, 'confidence': 0.0, 'info': 'No suitable match found'}}
 
-            for ref_path in references:
-                if ref_path not in used_references:
+            for i, ref_path in enumerate(references):
+                if not used[i]:
                     yield {'type': 'match', 'data': {'remux_path': None, 'reference_path': str(ref_path), 'confidence': 0.0, 'info': 'Reference file not used', 'status': 'Unused'}}
 
-    def _get_matcher(self):
-        if self._mode == "correlation":
-            from matchers.audio.correlation import CorrelationMatcher
-            return CorrelationMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "chromaprint":
-            from matchers.audio.chromaprint import ChromaprintMatcher
-            return ChromaprintMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "peak_matcher":
-            from matchers.audio.peak_matcher import PeakMatcher
-            return PeakMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "invariant_matcher":
-            from matchers.audio.invariant_matcher import InvariantMatcher
-            return InvariantMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "mfcc":
-            from matchers.audio.mfcc import MFCCMatcher
-            return MFCCMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "phash":
-            from matchers.video.phash import PerceptualHashMatcher
-            return PerceptualHashMatcher(self.cache, self.config, self.app_data_dir)
-        elif self._mode == "scene":
-            from matchers.video.scene import SceneDetectionMatcher
-            return SceneDetectionMatcher(self.cache, self.config, self.app_data_dir)
-        return None
+    def _extract_fingerprints(self, jobs: list, cfg: MatchConfig):
+        """
+        Yields (is_ref, index, path, fingerprint) as each file finishes.
+        Files are fingerprinted in parallel worker processes, or on the
+        compare thread pool for matchers whose work happens outside the GIL;
+        a single file, or a single worker, runs in-process. Fingerprints
+        persisted by an earlier run are yielded without starting a worker.
+        """
+        lookup = getattr(self._matcher, 'cached_fingerprints', None)
+        fp_key = getattr(self._matcher, 'fingerprint_key', None) or cfg.mode
+        hits = lookup([path for _, _, path in jobs], cfg.language) if lookup else {}
+        misses = []
+        for is_ref, idx, path in jobs:
+            cached = hits.get(path) if lookup else self.cache.get_fingerprint(path, fp_key, cfg.language)
+            if cached is not None:
+                yield is_ref, idx, path, cached
+            else:
+                misses.append((is_ref, idx, path))
+        jobs = misses
+        if not jobs: return
+
+        workers = min(self.config.get('match_workers', 0) or os.cpu_count() or 1, len(jobs))
+        if workers <= 1:
+            for is_ref, idx, path in jobs:
+                if not self._running: return
+                yield is_ref, idx, path, self._matcher.get_fingerprint(path, cfg.language)
+            return
 
-    def _should_compare(self, ref_path: Path, remux_path: Path) -> bool:
-        ref_duration = self.cache.get_duration(ref_path)
-        remux_duration = self.cache.get_duration(remux_path)
-        if ref_duration and remux_duration:
-            if abs(ref_duration - remux_duration) > 5.0:
-                return False
-        return True
+        if getattr(self._matcher, 'threaded_fingerprints', False):
+            futures = {
+                self._pool.submit(self._matcher.get_fingerprint, path, cfg.language): (is_ref, idx, path)
+                for is_ref, idx, path in jobs
+            }
+            self._pending = list(futures)
+            try:
+                for future in as_completed(futures):
+                    if not self._running: return
+                    is_ref, idx, path = futures[future]
+                    yield is_ref, idx, path, future.result()
+            finally:
+                for future in futures: future.cancel()
+                self._pending = []
+            return
+
+        # spawn, not fork: the GUI process has Qt and pool threads running
+        pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_fp_worker,
+            initargs=(cfg.mode, _settings_snapshot(self.config), self.app_data_dir, getattr(self.cache, 'db_path', None)),
+        )
+        self._process_pool = pool
+        try:
+            futures = {pool.submit(_fp_worker, path, cfg.language): (is_ref, idx, path) for is_ref, idx, path in jobs}
+            for future in as_completed(futures):
+                if not self._running: return
+                is_ref, idx, path = futures[future]
+                fp = future.result()
+                if fp is not None: self.cache.set_fingerprint(path, fp_key, cfg.language, fp)
+                yield is_ref, idx, path, fp
+        finally:
+            self._process_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _stack_fingerprints(self, fingerprints: Dict[int, Any]) -> Tuple[List[int], Any]:
+        """
+        Packs {index: fingerprint} into the matcher's contiguous layout, once
+        per side, plus the file index of each packed row.
+        """
+        rows = list(fingerprints)
+        return rows, self._matcher.stack_fingerprints([fingerprints[k] for k in rows])
+
+    def _ref_stack_base(self, cfg: MatchConfig, references: List[Path]) -> Path:
+        """Stack file stem for this mode, language and exact set of reference file versions."""
+        digest = hashlib.sha1('\n'.join(sorted(self._file_key(p) for p in references)).encode()).hexdigest()[:16]
+        fp_key = getattr(self._matcher, 'fingerprint_key', None) or cfg.mode
+        return self.app_data_dir / "fp_cache" / f"{fp_key}_{cfg.language or 'any'}_{digest}"
+
+    def _load_ref_stack(self, base: Path, references: List[Path]) -> Tuple[Optional[List[int]], Any]:
+        """Memory-maps a saved reference stack; (None, None) when there is none."""
+        try:
+            meta = json.loads(base.with_name(base.name + '.json').read_text())
+            stack = tuple(np.load(base.with_name(f'{base.name}.{k}.npy'), mmap_mode='r') for k in range(meta['arrays']))
+            index = {str(p): i for i, p in enumerate(references)}
+            rows = [index[p] for p in meta['paths']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+        return rows, stack
+
+    def _save_ref_stack(self, base: Path, paths: List[Path], stack: Tuple[np.ndarray, ...]):
+        """Writes a reference stack as .npy arrays plus a .json manifest, replacing older stacks for the mode."""
+        try:
+            base.parent.mkdir(exist_ok=True)
+            prefix = base.name.rsplit('_', 1)[0]
+            for old in base.parent.glob(f'{prefix}_*'):
+                if not old.name.startswith(base.name + '.'): old.unlink()
+            for k, array in enumerate(stack):
+                np.save(base.with_name(f'{base.name}.{k}.npy'), np.asarray(array), allow_pickle=False)
+            # The manifest goes last, so a partial write is never loaded
+            base.with_name(base.name + '.json').write_text(json.dumps({'arrays': len(stack), 'paths': [str(p) for p in paths]}))
+        except OSError:
+            pass
+
+    def _shortlist(self, ref_path: Path, remuxes: List[Path], candidates: List[int], language: Optional[str]) -> List[int]:
+        """
+        Keep the CHEAP_TOP_K candidates with the best cheap_score estimate.
+        Candidates without an estimate (score <= 0) are always kept.
+        """
+        if len(candidates) <= CHEAP_TOP_K:
+            return candidates
+        known, unknown = [], []
+        for j in candidates:
+            estimate = self._matcher.cheap_score(ref_path, remuxes[j], language)
+            if estimate > 0: known.append((estimate, j))
+            else: unknown.append(j)
+        if len(known) <= CHEAP_TOP_K:
+            return candidates
+        return sorted(unknown + [j for _, j in heapq.nlargest(CHEAP_TOP_K, known)])
+
+    def _get_matcher(self):
+        matcher = self._matcher_cache.get(self._mode)
+        if matcher is None:
+            matcher = _create_matcher(self._mode, self.cache, self.config, self.app_data_dir)
+            if matcher is None: return None
+            self._matcher_cache[self._mode] = matcher
+        # A previous run may have stopped it
+        matcher.start()
+        return matcher
+
+    def _file_key(self, path: Path) -> str:
+        """Path plus mtime/size, so memoised scores go stale when a file changes."""
+        try:
+            st = path.stat()
+            return f"{path}|{st.st_mtime_ns}|{st.st_size}"
+        except OSError:
+            return str(path)
+
+    def _assign_references(self, scores: np.ndarray) -> np.ndarray:
+        """
+        Pick one reference row per remux column, maximising the total score so
+        an early greedy match cannot starve a better one. Returns -1 where a
+        remux has no scored reference.
+        """
+        n_refs, n_remuxes = scores.shape
+        best_refs = np.full(n_remuxes, -1, dtype=int)
+        if n_refs == 0 or n_remuxes == 0:
+            return best_refs
+
+        if scores.size <= ASSIGNMENT_MAX_CELLS:
+            from scipy.optimize import linear_sum_assignment
+            rows, cols = linear_sum_assignment(scores, maximize=True)
+            best_refs[cols] = rows
+        else:
+            best_refs[:] = scores.argmax(axis=0)
+
+        assigned = best_refs >= 0
+        cols = np.flatnonzero(assigned)
+        best_refs[cols[scores[best_refs[cols], cols] < 0]] = -1
+        return best_refs
+
+    def _best_scores(self, scores: np.ndarray, best_refs: np.ndarray) -> np.ndarray:
+        """Score of each remux's assigned reference, -1 where none was assigned."""
+        best_scores = np.full(len(best_refs), -1.0)
+        cols = np.flatnonzero(best_refs >= 0)
+        best_scores[cols] = scores[best_refs[cols], cols]
+        return best_scores
+
+    def _used_references(self, n_refs: int, best_refs: np.ndarray, best_scores: np.ndarray, threshold: float) -> np.ndarray:
+        """Boolean mask of references confidently assigned to some remux."""
+        used = np.zeros(n_refs, dtype=bool)
+        used[best_refs[(best_refs >= 0) & (best_scores >= threshold)]] = True
+        return used
+
+    def _durations(self, paths: List[Path]) -> np.ndarray:
+        """Cached durations in seconds, -1 where unknown."""
+        return np.array([self.cache.get_duration(str(p)) or -1.0 for p in paths])
+
+    def _compatibility_mask(self, ref_durations: np.ndarray, remux_durations: np.ndarray) -> np.ndarray:
+        """Boolean (refs x remuxes) matrix of pairs whose known durations are within tolerance."""
+        from core.prefilter import compat_mask
+        return compat_mask(ref_durations, remux_durations, DURATION_TOLERANCE_S)
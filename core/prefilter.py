@@ -0,0 +1,44 @@
+"""
+core/prefilter.py - Duration compatibility pre-filter
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# Below this many cells the NumPy broadcast beats JIT dispatch overhead
+NUMBA_MIN_CELLS = 1_000_000
+
+def _compat_mask_numpy(ref_durations: np.ndarray, remux_durations: np.ndarray, tolerance: float) -> np.ndarray:
+    unknown = (ref_durations[:, None] <= 0) | (remux_durations[None, :] <= 0)
+    close = np.abs(ref_durations[:, None] - remux_durations[None, :]) <= tolerance
+    return unknown | close
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, boundscheck=False, cache=True)
+    def _compat_mask_numba(ref_durations, remux_durations, tolerance):
+        n, m = ref_durations.size, remux_durations.size
+        out = np.ones((n, m), np.bool_)
+        for i in prange(n):
+            a = ref_durations[i]
+            if a <= 0: continue
+            for j in range(m):
+                b = remux_durations[j]
+                if b > 0 and abs(a - b) > tolerance:
+                    out[i, j] = False
+        return out
+
+def compat_mask(ref_durations: np.ndarray, remux_durations: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Boolean (refs x remuxes) matrix of pairs whose durations are within
+    tolerance. Durations <= 0 mean unknown and are compatible with anything.
+    """
+    ref_durations = np.ascontiguousarray(ref_durations, dtype=np.float64)
+    remux_durations = np.ascontiguousarray(remux_durations, dtype=np.float64)
+    if HAVE_NUMBA and ref_durations.size * remux_durations.size >= NUMBA_MIN_CELLS:
+        return _compat_mask_numba(ref_durations, remux_durations, tolerance)
+    return _compat_mask_numpy(ref_durations, remux_durations, tolerance)
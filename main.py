@@ -4,6 +4,7 @@ Video Episode Renamer - Main GUI Application
 Matches and renames video files based on reference files with correct names
 """
 
+import os
 import sys
 import json
 from pathlib import Path
@@ -16,8 +17,8 @@ from PyQt6.QtWidgets import (
     QTableWidgetItem, QHeaderView, QProgressBar, QMessageBox,
     QComboBox, QSlider, QSpinBox, QGroupBox, QDialog, QDialogButtonBox
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt
-from PyQt6.QtGui import QColor, QAction
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal, Qt
+from PyQt6.QtGui import QColor, QAction, QBrush
 
 from core.pipeline import MatchingPipeline
 from core.cache import MediaCache
@@ -33,6 +34,7 @@ class MatchResult:
 class MatcherThread(QThread):
     progress = pyqtSignal(str, int)
     match_found = pyqtSignal(dict)
+    matches_found = pyqtSignal(list)
     finished = pyqtSignal()
 
     def __init__(self, pipeline, references, remuxes):
@@ -48,6 +50,7 @@ class MatcherThread(QThread):
                 if self._stop_requested: break
                 if result['type'] == 'progress': self.progress.emit(result['message'], result['value'])
                 elif result['type'] == 'match': self.match_found.emit(result['data'])
+                elif result['type'] == 'match_batch': self.matches_found.emit(result['data'])
         except Exception as e:
             self.progress.emit(f"Error: {str(e)}", 0)
         finally:
@@ -105,15 +108,33 @@ class SettingsDialog(QDialog):
         return {'panako_jar': self.panako_path_edit.text(), 'analysis_start_percent': self.offset_spinbox.value()}
 
 class VideoEpisodeRenamer(QMainWindow):
+    # Shared row brushes, so filling a result row allocates no colours
+    _STATUS_BRUSHES = {
+        "Unused": QBrush(QColor(220, 220, 220)),
+        "Matched": QBrush(QColor(144, 238, 144)),
+        "Low Confidence": QBrush(QColor(255, 200, 150)),
+        "Unmatched": QBrush(QColor(255, 182, 193)),
+    }
+    _TEXT_BRUSH = QBrush(QColor(0, 0, 0))
+    # Incoming matches are coalesced and flushed on this interval, or sooner once this many queue up
+    FLUSH_INTERVAL_MS = 100
+    FLUSH_ROWS = 32
+    VIDEO_EXTENSIONS = frozenset({'.mkv', '.mp4', '.avi', '.mov', '.ts', '.m2ts'})
+
     def __init__(self):
         super().__init__()
         self.config = Config()
-        self.cache = MediaCache()
         self.app_data_dir = Path.cwd() / "app_data"
         self.app_data_dir.mkdir(exist_ok=True)
+        self.cache = MediaCache(db_path=self.app_data_dir / "cache.db")
         self.pipeline = MatchingPipeline(self.cache, self.config, self.app_data_dir)
         self.matcher_thread = None
         self.match_results = []
+        self._row_by_orig_name: Dict[str, int] = {}
+        self._pending_matches: List[dict] = []
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._flush_timer.timeout.connect(self._flush_pending_matches)
         self.init_ui()
         self.load_settings()
 
@@ -151,6 +172,7 @@ class VideoEpisodeRenamer(QMainWindow):
         self.mode_combo.addItems([
             "Correlation (Audio)",
             "Chromaprint (Audio)",
+            "Cascade (Audio)",
             "Peak Matcher (Audio)",
             "Invariant Matcher (Audio)",
             "MFCC (Audio)",
@@ -257,6 +279,7 @@ class VideoEpisodeRenamer(QMainWindow):
         mode_map = {
             "Correlation (Audio)": "correlation",
             "Chromaprint (Audio)": "chromaprint",
+            "Cascade (Audio)": "cascade",
             "Peak Matcher (Audio)": "peak_matcher",
             "Invariant Matcher (Audio)": "invariant_matcher",
             "MFCC (Audio)": "mfcc",
@@ -269,9 +292,13 @@ class VideoEpisodeRenamer(QMainWindow):
         self.pipeline.set_threshold(self.confidence_slider.value() / 100.0)
         self.results_table.setRowCount(0)
         self.match_results.clear()
+        self._row_by_orig_name.clear()
+        self._pending_matches.clear()
+        self._flush_timer.start()
         self.matcher_thread = MatcherThread(self.pipeline, ref_files, remux_files)
         self.matcher_thread.progress.connect(self.update_progress)
         self.matcher_thread.match_found.connect(self.add_match_result)
+        self.matcher_thread.matches_found.connect(self.add_match_results)
         self.matcher_thread.finished.connect(self.matching_finished)
         self.matcher_thread.start()
 
@@ -285,44 +312,63 @@ class VideoEpisodeRenamer(QMainWindow):
         self.status_label.setText(message)
         self.progress.setValue(value)
 
+    def add_match_results(self, batch):
+        self._pending_matches.extend(batch)
+        if len(self._pending_matches) >= self.FLUSH_ROWS: self._flush_pending_matches()
+
     def add_match_result(self, match_data):
+        self.add_match_results([match_data])
+
+    def _flush_pending_matches(self):
+        # One row-count change and one repaint for everything queued since the last flush
+        if not self._pending_matches: return
+        batch, self._pending_matches = self._pending_matches, []
+        table = self.results_table
+        sorting = table.isSortingEnabled()
+        table.setUpdatesEnabled(False)
+        table.setSortingEnabled(False)
+        table.blockSignals(True)
+        try:
+            first_row = table.rowCount()
+            table.setRowCount(first_row + len(batch))
+            for offset, match_data in enumerate(batch):
+                self._fill_result_row(first_row + offset, match_data)
+        finally:
+            table.blockSignals(False)
+            table.setSortingEnabled(sorting)
+            table.setUpdatesEnabled(True)
+
+    def _fill_result_row(self, row, match_data):
         self.match_results.append(match_data)
-        row = self.results_table.rowCount()
-        self.results_table.insertRow(row)
         if match_data.get('remux_path'):
-            orig_item = QTableWidgetItem(Path(match_data['remux_path']).name)
-            if match_data.get('reference_path'): proposed = QTableWidgetItem(Path(match_data['reference_path']).name)
-            else: proposed = QTableWidgetItem("")
+            orig_name = os.path.basename(match_data['remux_path'])
+            self._row_by_orig_name.setdefault(orig_name, row)
+            proposed_name = os.path.basename(match_data['reference_path']) if match_data.get('reference_path') else ""
         else:
-            orig_item = QTableWidgetItem("---")
-            proposed = QTableWidgetItem(Path(match_data['reference_path']).name)
-        self.results_table.setItem(row, 0, orig_item)
-        self.results_table.setItem(row, 1, proposed)
+            orig_name, proposed_name = "---", os.path.basename(match_data['reference_path'])
         conf = match_data.get('confidence', 0)
-        conf_item = QTableWidgetItem(f"{conf:.1%}")
-        self.results_table.setItem(row, 2, conf_item)
-        info_item = QTableWidgetItem(match_data.get('info', ''))
-        self.results_table.setItem(row, 3, info_item)
         threshold = self.confidence_slider.value() / 100.0
         status_text = match_data.get('status', '')
         if status_text == 'Unused':
-            status, color = "Unused", QColor(220, 220, 220)
+            status = "Unused"
         elif match_data.get('reference_path') and conf >= threshold:
-            status, color = "Matched", QColor(144, 238, 144)
+            status = "Matched"
         elif match_data.get('reference_path'):
-            status, color = "Low Confidence", QColor(255, 200, 150)
+            status = "Low Confidence"
         else:
-            status, color = "Unmatched", QColor(255, 182, 193)
-        status_item = QTableWidgetItem(status)
-        self.results_table.setItem(row, 4, status_item)
-        for col in range(5):
-            item = self.results_table.item(row, col)
-            if item:
-                item.setBackground(color)
-                item.setForeground(QColor(0, 0, 0))
+            status = "Unmatched"
+        # Items are styled before insertion so the table lays out each cell once
+        background, foreground = self._STATUS_BRUSHES[status], self._TEXT_BRUSH
+        for col, text in enumerate((orig_name, proposed_name, f"{conf:.1%}", match_data.get('info', ''), status)):
+            item = QTableWidgetItem(text)
+            item.setBackground(background)
+            item.setForeground(foreground)
+            self.results_table.setItem(row, col, item)
         if status == "Matched": self.rename_btn.setEnabled(True)
 
     def matching_finished(self):
+        self._flush_timer.stop()
+        self._flush_pending_matches()
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.status_label.setText("Matching complete")
@@ -347,10 +393,11 @@ class VideoEpisodeRenamer(QMainWindow):
             try:
                 if new.exists(): errors.append(f"{new.name} already exists"); continue
                 orig.rename(new); success += 1
-                for row in range(self.results_table.rowCount()):
-                    if self.results_table.item(row, 0) and self.results_table.item(row, 0).text() == orig.name:
-                        self.results_table.item(row, 0).setText(new.name)
-                        self.results_table.item(row, 4).setText("Renamed"); break
+                row = self._row_by_orig_name.pop(orig.name, None)
+                if row is not None:
+                    self.results_table.item(row, 0).setText(new.name)
+                    self.results_table.item(row, 4).setText("Renamed")
+                    self._row_by_orig_name[new.name] = row
             except Exception as e: errors.append(f"{orig.name}: {str(e)}")
         msg = f"Successfully renamed {success} files"
         if errors:
@@ -363,10 +410,12 @@ class VideoEpisodeRenamer(QMainWindow):
         self.cache.clear(); self.status_label.setText("Cache cleared")
 
     def get_video_files(self, folder: Path) -> List[Path]:
-        extensions = {'.mkv', '.mp4', '.avi', '.mov', '.ts', '.m2ts'}
-        files = []
-        for ext in extensions:
-            files.extend(folder.glob(f"*{ext}")); files.extend(folder.glob(f"*{ext.upper()}"))
+        # One directory read; suffixes match case-insensitively
+        try:
+            with os.scandir(folder) as entries:
+                files = [Path(e.path) for e in entries if os.path.splitext(e.name)[1].lower() in self.VIDEO_EXTENSIONS and e.is_file()]
+        except OSError:
+            return []
         return sorted(files)
 
     def load_settings(self):
@@ -7,5 +7,6 @@ from .correlation import CorrelationMatcher
 from .chromaprint import ChromaprintMatcher
 from .mfcc import MFCCMatcher
 from .panako import PanakoMatcher
+from .cascade import CascadeMatcher
 
-__all__ = ['CorrelationMatcher', 'ChromaprintMatcher', 'MFCCMatcher', 'PanakoMatcher']
+__all__ = ['CorrelationMatcher', 'ChromaprintMatcher', 'MFCCMatcher', 'PanakoMatcher', 'CascadeMatcher']
@@ -0,0 +1,57 @@
+# ===========================================
+# matchers/audio/cascade.py
+# ===========================================
+
+from pathlib import Path
+from typing import Tuple, Optional
+from core.matcher import BaseMatcher
+from .chromaprint import ChromaprintMatcher
+from .correlation import CorrelationMatcher
+
+class CascadeMatcher(BaseMatcher):
+    """Chromaprint coarse filter followed by correlation on surviving pairs"""
+
+    __slots__ = ('coarse', 'fine', 'min_similarity')
+
+    def __init__(self, cache, config, app_data_dir: Path):
+        super().__init__(cache, config, app_data_dir)
+        self.coarse = ChromaprintMatcher(cache, config, app_data_dir)
+        self.fine = CorrelationMatcher(cache, config, app_data_dir)
+        self.min_similarity = config.get('cascade_min_similarity', 0.5)
+
+    @property
+    def score_key(self) -> str:
+        """Rejections depend on the threshold, so memoised scores are kept per threshold"""
+        return f"cascade@{self.min_similarity}"
+
+    def start(self):
+        super().start()
+        self.coarse.start()
+        self.fine.start()
+
+    def stop(self):
+        super().stop()
+        self.coarse.stop()
+        self.fine.stop()
+
+    def prefetch(self, paths, language: Optional[str] = None, max_workers: Optional[int] = None):
+        """Warms the coarse fingerprints, which also lets cheap_score shortlist every pair"""
+        self.coarse.prefetch(paths, language, max_workers)
+
+    def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
+        ref_fp = self.coarse.get_fingerprint(ref_path, language)
+        remux_fp = self.coarse.get_fingerprint(remux_path, language)
+        if ref_fp is not None and remux_fp is not None:
+            similarity = self.coarse.compare_fingerprints(ref_fp, remux_fp, self.min_similarity)
+            if similarity < self.min_similarity:
+                return -1.0, f"Rejected by Chromaprint (below {self.min_similarity:.0%})"
+        return self.fine.compare(ref_path, remux_path, language)
+
+    def cheap_score(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> float:
+        """Chromaprint similarity against an already-fingerprinted remux"""
+        remux_idx = self.get_audio_stream_index(remux_path, language)
+        remux_fp = self.cache.get_chromaprint(remux_path, remux_idx) if remux_idx is not None else None
+        if remux_fp is None: return 0.0
+        ref_fp = self.coarse.get_fingerprint(ref_path, language)
+        if ref_fp is None: return 0.0
+        return self.coarse.compare_fingerprints(ref_fp, remux_fp)
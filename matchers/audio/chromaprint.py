@@ -2,49 +2,209 @@
 # matchers/audio/chromaprint.py
 # ===========================================
 
+import os
 import subprocess
 import json
+import heapq
+import functools
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Optional, Any
+from typing import Tuple, Optional, Any, List, Dict, Iterable
 from core.matcher import BaseMatcher
 from utils.media import get_media_duration
 
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# In-process decode + libchromaprint (PyAV, pyacoustid); ffmpeg | fpcalc otherwise
+try:
+    import av
+    import chromaprint as _chromaprint
+    HAVE_NATIVE_CHROMAPRINT = True
+    _NATIVE_ERRORS = (getattr(av, 'FFmpegError', getattr(av, 'AVError', OSError)), _chromaprint.FingerprintError,
+                      OSError, ValueError, IndexError)
+except (ImportError, OSError):
+    HAVE_NATIVE_CHROMAPRINT = False
+
+# Chromaprint's own analysis rate: decoding straight to it skips its internal resample
+FP_SAMPLE_RATE = 11025
+
+# Bits set in every byte value, for NumPy builds without bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Above this many references, an inverted hash index picks the few worth scoring
+INDEX_MIN_REFS = 16
+INDEX_TOP_K = 5
+# Remuxes scored per broadcast block; bounds the (refs, tile, width) XOR buffer
+REMUX_TILE = 16
+# uint64 lanes (256 fingerprint words) popcounted between early-exit checks
+EARLY_EXIT_BLOCK = 128
+
+def _popcount64(words: np.ndarray) -> np.ndarray:
+    """Per-element popcount of a uint64 array (SIMD popcount on NumPy >= 2.0)."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+@functools.lru_cache(maxsize=4096)
+def _parse_fingerprint(fp: str) -> np.ndarray:
+    """CSV fingerprint -> read-only uint32 array, parsed once per distinct string."""
+    words = np.array(fp.split(','), dtype=np.int64).astype(np.uint32)
+    words.flags.writeable = False
+    return words
+
+def _as_words(fp: Any) -> Optional[np.ndarray]:
+    if isinstance(fp, np.ndarray): return fp
+    if isinstance(fp, str): return _parse_fingerprint(fp)
+    return None
+
+def _popcount_total(words: np.ndarray) -> int:
+    """Total set bits across an unsigned integer array of any width."""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum())
+    return int(_POPCOUNT_TABLE[words.view(np.uint8)].sum())
+
+if HAVE_NUMBA:
+    @njit(inline='always')
+    def _swar64(x):
+        """Set bits in one uint64; LLVM folds this pattern into a hardware popcount."""
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _popcount_rows_swar(words):
+        """Row sums of per-word popcounts over a (rows, n) uint64 matrix (SWAR)."""
+        out = np.zeros(words.shape[0], np.int64)
+        for i in prange(words.shape[0]):
+            s = 0
+            for k in range(words.shape[1]):
+                s += _swar64(words[i, k])
+            out[i] = s
+        return out
+
+    # Serial: one fingerprint is a few thousand words, too few to pay for thread start-up
+    @njit(cache=True, boundscheck=False)
+    def _hamming_distance_swar(a, b, n, limit):
+        """Differing bits over the first n words of two uint32 arrays, stopping once past limit."""
+        s = 0
+        for k in range(n):
+            s += _swar64(np.uint64(a[k] ^ b[k]))
+            if s > limit: break
+        return s
+
+def _popcount_rows(words: np.ndarray) -> np.ndarray:
+    """Row sums of popcounts; a Numba SWAR kernel stands in when NumPy lacks bitwise_count."""
+    if HAVE_NUMBA and not hasattr(np, 'bitwise_count'):
+        return _popcount_rows_swar(np.ascontiguousarray(words))
+    return _popcount64(words).sum(axis=1)
+
 class ChromaprintMatcher(BaseMatcher):
     """Audio fingerprinting using Chromaprint/AcoustID"""
 
+    __slots__ = ()
+
+    # ffmpeg and fpcalc do the work in their own processes
+    threaded_fingerprints = True
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
 
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         ref_fp = self.get_fingerprint(ref_path, language)
         remux_fp = self.get_fingerprint(remux_path, language)
-        if not ref_fp or not remux_fp:
+        if ref_fp is None or remux_fp is None:
             return -1.0, "Failed to generate fingerprint"
         score = self.compare_fingerprints(ref_fp, remux_fp)
         return score, f"Chromaprint similarity: {score:.1%}"
 
+    def cached_fingerprints(self, paths: Iterable[Path], language: Optional[str] = None) -> Dict[Path, np.ndarray]:
+        """Already-cached fingerprints for paths, looked up in one bulk cache read."""
+        streams = {path: self.get_audio_stream_index(path, language) for path in dict.fromkeys(paths)}
+        streams = {path: idx for path, idx in streams.items() if idx is not None}
+        found = self.cache.get_chromaprints_bulk(streams.items())
+        hits = {}
+        for path, idx in streams.items():
+            fp = found.get((self.cache._key(path), idx))
+            if fp is not None: hits[path] = fp
+        return hits
+
+    def prefetch(self, paths: Iterable[Path], language: Optional[str] = None, max_workers: Optional[int] = None):
+        """Fingerprints paths concurrently, at most max_workers ffmpeg|fpcalc pairs at once, so later compares hit the cache."""
+        paths = list(dict.fromkeys(paths))
+        hits = self.cached_fingerprints(paths, language)
+        misses = [path for path in paths if path not in hits]
+        if not misses: return
+        def fetch(path):
+            if self._running: self.get_fingerprint(path, language)
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, thread_name_prefix="fpcalc") as pool:
+            list(pool.map(fetch, misses))
+
     def get_fingerprint(self, path: Path, language: Optional[str] = None) -> Optional[Any]:
         """Public method to generate or retrieve a single fingerprint."""
         stream_idx = self.get_audio_stream_index(path, language)
         if stream_idx is None: return None
 
         cached = self.cache.get_chromaprint(path, stream_idx)
-        if cached: return cached
+        if cached is not None: return cached
 
         duration = get_media_duration(path)
         analysis_duration_s = 120
         start_percent = self.config.get('analysis_start_percent', 15) / 100.0
         start_offset_s = (duration * start_percent) if duration else 0
 
-        seek_args = []
-        if duration and duration > (start_offset_s + analysis_duration_s):
-            seek_args.extend(['-ss', str(start_offset_s)])
+        if not (duration and duration > (start_offset_s + analysis_duration_s)):
+            start_offset_s = 0
+
+        fingerprint = None
+        if HAVE_NATIVE_CHROMAPRINT:
+            fingerprint = self._fingerprint_native(path, stream_idx, start_offset_s, analysis_duration_s)
+        if fingerprint is None:
+            fingerprint = self._fingerprint_fpcalc(path, stream_idx, start_offset_s, analysis_duration_s)
+        if not fingerprint: return None
+        # fpcalc may print words as signed ints; keep the low 32 bits either way
+        words = np.asarray(fingerprint, dtype=np.int64).astype(np.uint32)
+        self.cache.set_chromaprint(path, stream_idx, words)
+        return self.cache.get_chromaprint(path, stream_idx)
 
+    def _fingerprint_native(self, path: Path, stream_idx: int, start_s: float, duration_s: float) -> Optional[List[int]]:
+        """Decodes in-process with PyAV and feeds mono PCM at FP_SAMPLE_RATE straight to libchromaprint."""
         try:
-            audio_rate, audio_channels, audio_format = '16000', '1', 's16le'
+            with av.open(str(path)) as container:
+                stream = container.streams[stream_idx]
+                if start_s: container.seek(int(start_s * av.time_base))
+                resampler = av.AudioResampler(format='s16', layout='mono', rate=FP_SAMPLE_RATE)
+                fingerprinter = _chromaprint.Fingerprinter()
+                fingerprinter.start(FP_SAMPLE_RATE, 1)
+                remaining = int(duration_s * FP_SAMPLE_RATE)
+                for frame in container.decode(stream):
+                    # Seeking lands on the preceding keyframe; skip up to the real start
+                    if frame.time is not None and frame.time < start_s: continue
+                    for resampled in resampler.resample(frame):
+                        pcm = resampled.to_ndarray().tobytes()[:remaining * 2]
+                        fingerprinter.feed(pcm)
+                        remaining -= len(pcm) // 2
+                    if remaining <= 0: break
+                raw, _ = _chromaprint.decode_fingerprint(fingerprinter.finish())
+        except _NATIVE_ERRORS:
+            return None
+        return list(raw) or None
+
+    def _fingerprint_fpcalc(self, path: Path, stream_idx: int, start_s: float, duration_s: float) -> Optional[List[int]]:
+        """Pipes ffmpeg's decode into fpcalc -raw."""
+        seek_args = ['-ss', str(start_s)] if start_s else []
+        try:
+            audio_rate, audio_channels, audio_format = str(FP_SAMPLE_RATE), '1', 's16le'
             ffmpeg_cmd = [
-                'ffmpeg', '-nostdin', '-v', 'error', *seek_args, '-i', str(path),
-                '-t', str(analysis_duration_s), '-map', f'0:{stream_idx}',
+                # One decoder thread: prefetch already runs one ffmpeg per core
+                'ffmpeg', '-nostdin', '-v', 'error', '-threads', '1', *seek_args, '-i', str(path),
+                '-t', str(duration_s), '-map', f'0:{stream_idx}',
                 '-ac', audio_channels, '-ar', audio_rate, '-f', audio_format, '-'
             ]
             fpcalc_cmd = [
@@ -58,27 +218,124 @@ class ChromaprintMatcher(BaseMatcher):
             stdout, _ = p_fpcalc.communicate(timeout=45)
 
             if p_fpcalc.returncode == 0:
-                result = json.loads(stdout)
-                fingerprint = result.get('fingerprint')
-                if fingerprint:
-                    fp_str = ','.join(map(str, fingerprint))
-                    self.cache.set_chromaprint(path, stream_idx, fp_str)
-                    return fp_str
+                return json.loads(stdout).get('fingerprint') or None
         except (subprocess.TimeoutExpired, FileNotFoundError, json.JSONDecodeError):
             pass
         return None
 
-    def compare_fingerprints(self, fp1: Any, fp2: Any) -> float:
-        """Compares two pre-computed fingerprints."""
-        if not isinstance(fp1, str) or not isinstance(fp2, str): return 0.0
-        arr1 = [int(x) for x in fp1.split(',')]
-        arr2 = [int(x) for x in fp2.split(',')]
+    def compare_fingerprints(self, fp1: Any, fp2: Any, threshold: Optional[float] = None) -> float:
+        """
+        Compares two pre-computed fingerprints, given as CSV strings or parsed
+        uint32 arrays. With a threshold, stops as soon as the pair can no longer
+        reach it and returns that partial score, an upper bound below threshold.
+        """
+        arr1, arr2 = _as_words(fp1), _as_words(fp2)
+        if arr1 is None or arr2 is None: return 0.0
         min_len = min(len(arr1), len(arr2))
-        arr1, arr2 = arr1[:min_len], arr2[:min_len]
-        if not arr1: return 0.0
-        matches, total_bits = 0, 0
-        for v1, v2 in zip(arr1, arr2):
-            xor = v1 ^ v2
-            matches += 32 - bin(xor).count('1')
-            total_bits += 32
-        return matches / total_bits if total_bits > 0 else 0.0
+        if not min_len: return 0.0
+        total_bits = 32 * min_len
+        # Most differing bits a pair may have and still score >= threshold
+        limit = total_bits if threshold is None else int((1.0 - threshold) * total_bits)
+        if HAVE_NUMBA and not hasattr(np, 'bitwise_count'):
+            diff = int(_hamming_distance_swar(arr1, arr2, min_len, limit))
+        else:
+            # Pairs of words as uint64 lanes halve the popcount work; an odd last word is counted on its own
+            even = min_len & ~1
+            a64, b64 = arr1[:even].view(np.uint64), arr2[:even].view(np.uint64)
+            step = max(len(a64), 1) if threshold is None else EARLY_EXIT_BLOCK
+            diff = 0
+            for start in range(0, len(a64), step):
+                diff += _popcount_total(a64[start:start + step] ^ b64[start:start + step])
+                if diff > limit: break
+            else:
+                if min_len & 1: diff += _popcount_total(arr1[even:min_len] ^ arr2[even:min_len])
+        return 1.0 - diff / total_bits
+
+    def fingerprints_to_matrix(self, fps: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stacks fingerprints into a zero-padded (n, width) uint32 matrix plus
+        their lengths. Width is kept even so rows can be viewed as uint64.
+        """
+        arrays = [_as_words(fp) for fp in fps]
+        lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+        width = int(lengths.max(initial=0))
+        matrix = np.zeros((len(arrays), width + (width & 1)), dtype=np.uint32)
+        for row, a in enumerate(arrays):
+            matrix[row, :len(a)] = a
+        return matrix, lengths
+
+    def compare_batch(self, query: np.ndarray, query_len: int, ref_matrix: np.ndarray, ref_lens: np.ndarray) -> np.ndarray:
+        """Scores one padded fingerprint row against every row of ref_matrix."""
+        width = min(query.shape[0], ref_matrix.shape[1])
+        xor = ref_matrix[:, :width] ^ query[:width]
+        n = np.minimum(ref_lens, query_len)
+        # Zero words past each pair's common length, then popcount 64 bits at a time
+        xor[np.arange(width)[None, :] >= n[:, None]] = 0
+        diff = _popcount_rows(xor.view(np.uint64))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(n > 0, 1.0 - diff / (32.0 * n), 0.0)
+
+    def compare_block(self, queries: np.ndarray, query_lens: np.ndarray, ref_matrix: np.ndarray, ref_lens: np.ndarray) -> np.ndarray:
+        """Scores several padded fingerprint rows against every row of ref_matrix in one broadcast; (refs x queries)."""
+        width = min(queries.shape[1], ref_matrix.shape[1])
+        xor = ref_matrix[:, None, :width] ^ queries[None, :, :width]
+        n = np.minimum(ref_lens[:, None], query_lens[None, :])
+        xor[np.arange(width) >= n[..., None]] = 0
+        diff = _popcount_rows(xor.reshape(-1, width).view(np.uint64)).reshape(n.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(n > 0, 1.0 - diff / (32.0 * n), 0.0)
+
+    def compare_fingerprints_matrix(self, ref_fps: List[str], remux_fps: List[str]) -> np.ndarray:
+        """
+        Scores every (ref, remux) pair at once; equivalent to calling
+        compare_fingerprints on each pair the hash index shortlists, with -1
+        for the rest. Returns a (refs x remuxes) matrix.
+        """
+        return self.compare_stacked(self.stack_fingerprints(ref_fps), self.stack_fingerprints(remux_fps))
+
+    def stack_fingerprints(self, fps: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Contiguous (matrix, lengths) form of a fingerprint list, for compare_stacked."""
+        return self.fingerprints_to_matrix(fps)
+
+    def compare_stacked(self, ref_stack: Tuple[np.ndarray, np.ndarray], remux_stack: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        """(refs x remuxes) scores between two stack_fingerprints results; -1 for pairs never scored."""
+        refs, ref_lens = ref_stack
+        remuxes, remux_lens = remux_stack
+        scores = np.full((len(refs), len(remuxes)), -1.0)
+        index = self.build_hash_index(refs, ref_lens) if len(refs) > INDEX_MIN_REFS else None
+        if index is None:
+            for start in range(0, len(remuxes), REMUX_TILE):
+                stop = start + REMUX_TILE
+                scores[:, start:stop] = self.compare_block(remuxes[start:stop], remux_lens[start:stop], refs, ref_lens)
+            return scores
+        for j in range(len(remuxes)):
+            candidates = self.compare_batch_indexed(index, remuxes[j], remux_lens[j])
+            if candidates:
+                # Refs sharing no aligned hashes stay at -1, so they are never assigned
+                scores[candidates, j] = self.compare_batch(remuxes[j], remux_lens[j], refs[candidates], ref_lens[candidates])
+            else:
+                scores[:, j] = self.compare_batch(remuxes[j], remux_lens[j], refs, ref_lens)
+        return scores
+
+    def build_hash_index(self, ref_matrix: np.ndarray, ref_lens: np.ndarray) -> Dict[int, List[Tuple[int, int]]]:
+        """Inverted index of hash value -> [(ref row, offset)] over every reference"""
+        index: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        for row, length in enumerate(ref_lens):
+            for offset, h in enumerate(ref_matrix[row, :length].tolist()):
+                index[h].append((row, offset))
+        return index
+
+    def compare_batch_indexed(self, index: Dict[int, List[Tuple[int, int]]], query: np.ndarray, query_len: int,
+                              top_k: int = INDEX_TOP_K) -> List[int]:
+        """
+        Votes (ref, time offset) bins for every query hash found in the index
+        and returns the top_k ref rows by their best-aligned bin count.
+        """
+        votes: Counter = Counter()
+        for q_offset, h in enumerate(query[:query_len].tolist()):
+            for row, r_offset in index.get(h, ()):
+                votes[row, q_offset - r_offset] += 1
+        best: Dict[int, int] = {}
+        for (row, _), count in votes.items():
+            if count > best.get(row, 0): best[row] = count
+        return heapq.nlargest(top_k, best, key=best.get)
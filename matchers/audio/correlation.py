@@ -2,18 +2,73 @@
 # matchers/audio/correlation.py
 # ===========================================
 
+import statistics
+import threading
+import weakref
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from scipy.signal import correlate
 from pathlib import Path
 from typing import Tuple, Optional
 from core.matcher import BaseMatcher
-from utils.media import extract_audio_segment
+from utils import fft
+from utils.media import extract_full_audio
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# Budget for chunk spectra kept between compares (one 15 s chunk at 48 kHz is ~5.8 MB)
+CHUNK_FFT_CACHE_MB = 256
+# Per-second energy profiles kept for the loudness pre-check (a few KB each)
+ENERGY_PROFILE_CACHE_ENTRIES = 64
+
+if HAVE_NUMBA:
+    # nogil: called from the GCC-PHAT thread pool, one chunk pair per call
+    @njit(cache=True, fastmath=True, boundscheck=False, nogil=True)
+    def _cross_phase_numba(REF, TEST, out):
+        """out = PHAT-weighted cross spectrum, in one pass with no temporaries"""
+        eps = np.float32(1e-12)
+        for k in range(REF.size):
+            r = REF[k] * np.conj(TEST[k])
+            out[k] = r / (abs(r) + eps)
+
+    @njit(cache=True, boundscheck=False, nogil=True)
+    def _abs_peak_numba(cc, max_shift):
+        """argmax/max of |cc| over wrapped lags -max_shift..max_shift, read in place"""
+        n = cc.size
+        best_i, best = 0, -1.0
+        for i in range(2 * max_shift + 1):
+            v = abs(cc[n - max_shift + i]) if i < max_shift else abs(cc[i - max_shift])
+            if v > best:
+                best_i, best = i, v
+        return best_i, best
+
+def _sum_sq(x: np.ndarray) -> float:
+    return float(np.einsum('i,i->', x, x, dtype=np.float64))
+
+def _centered(x: np.ndarray) -> np.ndarray:
+    return x - np.float32(x.mean(dtype=np.float64))
 
 class CorrelationMatcher(BaseMatcher):
     """Audio correlation matching using SCC/GCC-PHAT"""
 
+    __slots__ = ('_chunk_ffts', '_chunk_fft_bytes', '_chunk_fft_lock', '_energy_prefixes', 'use_phat')
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
+        # (id(audio), chunk layout) -> (weakref to audio, _chunk_spectra result); the
+        # weakref guards against a recycled id() of a since-freed buffer
+        self._chunk_ffts: 'OrderedDict[Tuple[int, int, int, int], tuple]' = OrderedDict()
+        self._chunk_fft_bytes = 0
+        self._chunk_fft_lock = threading.Lock()
+        self._energy_prefixes: 'OrderedDict[Tuple[int, int], tuple]' = OrderedDict()
+        # Plain cross-correlation when off: cheaper, and enough when only the delay matters
+        self.use_phat = config.get('correlation_use_phat', True)
 
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         # ... (rest of file is unchanged) ...
@@ -28,14 +83,14 @@ class CorrelationMatcher(BaseMatcher):
         remux_audio = self.cache.get_audio(remux_path, remux_idx, sr)
 
         if ref_audio is None:
-            ref_audio = extract_audio_segment(ref_path, ref_idx, sr)
+            ref_audio = extract_full_audio(ref_path, ref_idx, sr, self.cache.get_duration(ref_path))
             if ref_audio is not None:
-                self.cache.set_audio(ref_path, ref_idx, sr, ref_audio)
+                ref_audio = self.cache.set_audio(ref_path, ref_idx, sr, ref_audio)
 
         if remux_audio is None:
-            remux_audio = extract_audio_segment(remux_path, remux_idx, sr)
+            remux_audio = extract_full_audio(remux_path, remux_idx, sr, self.cache.get_duration(remux_path))
             if remux_audio is not None:
-                self.cache.set_audio(remux_path, remux_idx, sr, remux_audio)
+                remux_audio = self.cache.set_audio(remux_path, remux_idx, sr, remux_audio)
 
         if ref_audio is None or remux_audio is None:
             return 0.0, "Failed to extract audio"
@@ -51,53 +106,186 @@ class CorrelationMatcher(BaseMatcher):
         start = duration * 0.1
         end = duration * 0.9
         chunk_starts = np.linspace(start, end, n_chunks)
+        chunk_len = int(chunk_duration * sr)
+        starts = tuple(
+            start_idx for start_idx in (int(t * sr) for t in chunk_starts)
+            if start_idx + chunk_len <= len(ref_audio) and start_idx + chunk_len <= len(remux_audio)
+        )
         valid_correlations = []
         delays_ms = []
 
-        for start_time in chunk_starts:
-            if not self._running: break
-            start_idx = int(start_time * sr)
-            end_idx = start_idx + int(chunk_duration * sr)
-            if end_idx > len(ref_audio) or end_idx > len(remux_audio): continue
-            ref_chunk = ref_audio[start_idx:end_idx]
-            remux_chunk = remux_audio[start_idx:end_idx]
-            if self._rms(ref_chunk) < rms_threshold or self._rms(remux_chunk) < rms_threshold: continue
-            delay_ms, correlation = self._gcc_phat(ref_chunk, remux_chunk, sr)
-            if correlation > 0.5:
-                valid_correlations.append(correlation)
-                delays_ms.append(delay_ms)
+        if starts and self._running:
+            # Pairs that cannot reach min_valid_chunks for silence alone stop here,
+            # before either file's chunks are stacked or transformed
+            both = np.flatnonzero(self._loud_windows(ref_audio, starts, chunk_len, sr, rms_threshold)
+                                  & self._loud_windows(remux_audio, starts, chunk_len, sr, rms_threshold))
+            if both.size < min_valid_chunks:
+                return 0.0, f"Only {both.size}/{n_chunks} non-silent chunks"
+            if self.use_phat:
+                n = fft.next_fast_len(2 * chunk_len - 1)
+                ref_loud, REF, ref_energy = self._chunk_spectra(ref_audio, starts, chunk_len, n, rms_threshold)
+                remux_loud, TEST, test_energy = self._chunk_spectra(remux_audio, starts, chunk_len, n, rms_threshold)
+                # Chunks loud in both files, as rows of each file's stack of loud-chunk spectra
+                both = np.flatnonzero(ref_loud & remux_loud)
+                ref_rows, remux_rows = np.cumsum(ref_loud)[both] - 1, np.cumsum(remux_loud)[both] - 1
+                delays, correlations = self._gcc_phat_from_ffts(
+                    REF[ref_rows], TEST[remux_rows], ref_energy[ref_rows], test_energy[remux_rows], n, sr)
+            else:
+                delays, correlations = self._xcorr_chunks(
+                    ref_audio, remux_audio, [starts[i] for i in both], chunk_len, sr)
+            if len(delays):
+                good = correlations > 0.5
+                valid_correlations = correlations[good].tolist()
+                delays_ms = delays[good].tolist()
 
         if len(valid_correlations) < min_valid_chunks:
             return 0.0, f"Only {len(valid_correlations)}/{n_chunks} valid chunks"
 
         if delays_ms:
-            median_delay = np.median(delays_ms)
-            mad = np.median(np.abs(np.array(delays_ms) - median_delay))
+            # At most n_chunks values: plain-Python statistics beat NumPy's array/dispatch overhead
+            median_delay = statistics.median(delays_ms)
+            mad = statistics.median([abs(d - median_delay) for d in delays_ms])
             if mad > 50:
-                confidence = np.mean(valid_correlations) * 0.5
+                confidence = statistics.fmean(valid_correlations) * 0.5
                 return confidence, f"Inconsistent delays (MAD={mad:.0f}ms)"
             else:
-                confidence = np.mean(valid_correlations)
+                confidence = statistics.fmean(valid_correlations)
                 return confidence, f"Delay={median_delay:.0f}ms, {len(valid_correlations)}/{n_chunks} chunks"
 
         return 0.0, "No valid chunks"
 
-    def _gcc_phat(self, ref: np.ndarray, test: np.ndarray, sr: int) -> Tuple[float, float]:
-        ref = ref - np.mean(ref)
-        test = test - np.mean(test)
-        n = int(2 ** np.ceil(np.log2(len(ref) + len(test) - 1)))
-        REF = np.fft.rfft(ref, n)
-        TEST = np.fft.rfft(test, n)
-        R = REF * np.conj(TEST)
-        R_phat = R / (np.abs(R) + 1e-12)
-        cc = np.fft.irfft(R_phat, n)
+    def _loud_windows(self, audio: np.ndarray, starts: Tuple[int, ...], chunk_len: int, sr: int,
+                      rms_threshold: float) -> np.ndarray:
+        """
+        RMS gate per chunk from the file's per-second energy profile, plus the
+        partial seconds at each chunk's edges; matches the gate in _chunk_spectra.
+        """
+        prefix = self._energy_prefix(audio, sr)
+        loud = np.empty(len(starts), dtype=bool)
+        for k, s in enumerate(starts):
+            e = s + chunk_len
+            a, b = -(-s // sr), e // sr
+            if b <= a:
+                energy = _sum_sq(audio[s:e])
+            else:
+                energy = prefix[b] - prefix[a] + _sum_sq(audio[s:a * sr]) + _sum_sq(audio[b * sr:e])
+            loud[k] = np.sqrt(energy / chunk_len) >= rms_threshold
+        return loud
+
+    def _energy_prefix(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """Cumulative per-second sum of squares of audio, [0, s1, s1 + s2, ...]"""
+        key = (id(audio), sr)
+        with self._chunk_fft_lock:
+            entry = self._energy_prefixes.get(key)
+            if entry is not None and entry[0]() is audio:
+                self._energy_prefixes.move_to_end(key)
+                return entry[1]
+
+        seconds = audio[:len(audio) // sr * sr].reshape(-1, sr)
+        prefix = np.zeros(len(seconds) + 1)
+        np.cumsum(np.einsum('ij,ij->i', seconds, seconds, dtype=np.float64), out=prefix[1:])
+
+        with self._chunk_fft_lock:
+            self._energy_prefixes[key] = (weakref.ref(audio), prefix)
+            if len(self._energy_prefixes) > ENERGY_PROFILE_CACHE_ENTRIES:
+                self._energy_prefixes.popitem(last=False)
+        return prefix
+
+    def _chunk_spectra(self, audio: np.ndarray, starts: Tuple[int, ...], chunk_len: int, n: int,
+                       rms_threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (loud mask over starts, stacked spectra of the loud zero-mean chunks,
+        their energies). All chunks go through one batched 2-D rfft. A
+        reference is compared against many remuxes with the same layout, so
+        results are kept (LRU, byte budgeted) instead of recomputed per pair.
+        """
+        key = (id(audio), starts, chunk_len, n, rms_threshold)
+        with self._chunk_fft_lock:
+            entry = self._chunk_ffts.get(key)
+            if entry is not None and entry[0]() is audio:
+                self._chunk_ffts.move_to_end(key)
+                return entry[1]
+
+        # One pass over the stacked chunks yields RMS for the loudness gate and,
+        # from the same sums, the zero-mean energy used to normalise correlations
+        chunks = np.stack([audio[s:s + chunk_len] for s in starts], dtype=np.float32)
+        sums = chunks.sum(axis=1, dtype=np.float64)
+        sum_sq = np.einsum('ij,ij->i', chunks, chunks, dtype=np.float64)
+        loud = np.sqrt(sum_sq / chunk_len) >= rms_threshold
+        chunks, sums, sum_sq = chunks[loud], sums[loud], sum_sq[loud]
+        chunks -= (sums / chunk_len).astype(chunks.dtype)[:, None]
+        spectra = fft.rfft(chunks, n, axis=1)
+        energies = np.maximum(sum_sq - sums * sums / chunk_len, 0.0)
+        result = (loud, spectra, energies)
+
+        with self._chunk_fft_lock:
+            old = self._chunk_ffts.pop(key, None)
+            if old is not None: self._chunk_fft_bytes -= old[1][1].nbytes
+            self._chunk_ffts[key] = (weakref.ref(audio), result)
+            self._chunk_fft_bytes += spectra.nbytes
+            while self._chunk_fft_bytes > CHUNK_FFT_CACHE_MB * 1024 * 1024 and len(self._chunk_ffts) > 1:
+                _, evicted = self._chunk_ffts.popitem(last=False)
+                self._chunk_fft_bytes -= evicted[1][1].nbytes
+        return result
+
+    def _xcorr_chunks(self, ref_audio: np.ndarray, remux_audio: np.ndarray, starts, chunk_len: int,
+                      sr: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (delays in ms, correlations) from plain cross-correlation over lags
+        -max_shift..max_shift only: the remux chunk minus max_shift at each end
+        slides 'valid'-mode along the reference chunk. scipy picks direct or
+        FFT evaluation for the sizes.
+        """
+        max_shift = int(0.1 * sr)
+        delays, correlations = np.empty(len(starts)), np.empty(len(starts))
+        for k, s in enumerate(starts):
+            ref = _centered(ref_audio[s:s + chunk_len])
+            test = _centered(remux_audio[s + max_shift:s + chunk_len - max_shift])
+            cc = np.abs(correlate(ref, test, mode='valid', method='auto'))
+            peak_idx = int(np.argmax(cc))
+            delays[k] = (peak_idx - max_shift) / sr * 1000
+            correlations[k] = cc[peak_idx] / np.sqrt(_sum_sq(ref) * _sum_sq(test) + 1e-12)
+        return delays, correlations
+
+    def _gcc_phat_from_ffts(self, REF: np.ndarray, TEST: np.ndarray, ref_energy: np.ndarray, test_energy: np.ndarray,
+                            n: int, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (delays in ms, correlations) for each row pair of stacked chunk
+        spectra. REF is consumed: its rows become the PHAT cross spectra.
+        """
+        if not len(REF): return np.empty(0), np.empty(0)
         max_shift = int(0.1 * sr)
-        cc = np.concatenate([cc[-max_shift:], cc[:max_shift+1]])
-        peak_idx = np.argmax(np.abs(cc))
+        # Chunk pairs are independent and their element-wise work releases the GIL, so they
+        # run side by side, each with a single-threaded inverse FFT, in the FFT thread budget
+        workers = min(len(REF), fft.FFT_WORKERS)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gcc-phat") as pool:
+                results = list(pool.map(self._phat_peak, REF, TEST, repeat(n), repeat(max_shift)))
+        else:
+            results = [self._phat_peak(ref, test, n, max_shift) for ref, test in zip(REF, TEST)]
+        peak_idx, peaks = np.array(results).T
         delay_samples = peak_idx - max_shift
-        delay_ms = (delay_samples / sr) * 1000
-        correlation = np.abs(cc[peak_idx]) / np.sqrt(np.sum(ref**2) * np.sum(test**2) + 1e-12)
-        return delay_ms, float(correlation)
+        delays_ms = (delay_samples / sr) * 1000
+        correlations = peaks / np.sqrt(ref_energy * test_energy + 1e-12)
+        return delays_ms, correlations
 
-    def _rms(self, signal: np.ndarray) -> float:
-        return np.sqrt(np.mean(signal**2))
+    def _phat_peak(self, REF: np.ndarray, TEST: np.ndarray, n: int, max_shift: int) -> Tuple[int, float]:
+        """
+        (index into lags -max_shift..max_shift, value) of the GCC-PHAT |cc|
+        peak of one chunk pair. The cross spectrum is built in REF's buffer,
+        which the inverse FFT may then reuse as scratch.
+        """
+        if HAVE_NUMBA:
+            _cross_phase_numba(REF, TEST, REF)
+            peak_idx, peak = _abs_peak_numba(fft.irfft(REF, n, overwrite_x=True, workers=1), max_shift)
+            return int(peak_idx), float(peak)
+        R = np.multiply(REF, np.conj(TEST), out=REF)
+        R /= np.abs(R) + 1e-12
+        cc = fft.irfft(R, n, overwrite_x=True, workers=1)
+        # |cc| over the lag window, written straight from views of cc into one
+        # buffer instead of concatenating a copy and taking its abs
+        window = np.empty(2 * max_shift + 1, dtype=cc.dtype)
+        np.abs(cc[-max_shift:], out=window[:max_shift])
+        np.abs(cc[:max_shift+1], out=window[max_shift:])
+        peak_idx = int(np.argmax(window))
+        return peak_idx, float(window[peak_idx])
@@ -3,15 +3,21 @@
 # ===========================================
 
 import numpy as np
-from scipy.ndimage import maximum_filter
-from hashlib import sha1
+from scipy.ndimage import maximum_filter1d
 from pathlib import Path
-from typing import Tuple, Optional, Any, Set, Dict
-from collections import defaultdict
+from typing import Tuple, Optional, Any, List
 
 from core.matcher import BaseMatcher
+from .offset_hash import as_arrays, audio_digest, compare_fingerprints_matrix, compare_stacked, fingerprints_to_arrays, pair_score
+from utils import fft
 from utils.media import get_media_duration, extract_audio_segment
 
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
 # --- Constants for the algorithm ---
 SPECTROGRAM_FFT_SIZE = 4096
 SPECTROGRAM_WINDOW_SIZE = 4096
@@ -21,12 +27,80 @@ TARGET_ZONE_ANCHOR_DISTANCE_TIME = 10
 TARGET_ZONE_HEIGHT_FREQ = 100 # Smaller target zone for more precision
 TARGET_ZONE_WIDTH_TIME = 90
 
+def _pack_hash(anchor_freq, freq_delta, time_delta):
+    """anchor_freq << 40 | biased freq_delta << 20 | time_delta; 64 bits replace the old SHA-1 digest"""
+    return (anchor_freq << 40) | ((freq_delta + TARGET_ZONE_HEIGHT_FREQ) << 20) | time_delta
+
+def _target_windows(times: np.ndarray, by_time: np.ndarray):
+    """[lo, hi) of each anchor's target time window within the time-sorted peak times."""
+    t0 = times + TARGET_ZONE_ANCHOR_DISTANCE_TIME
+    return np.searchsorted(by_time, t0, side='left'), np.searchsorted(by_time, t0 + TARGET_ZONE_WIDTH_TIME, side='left')
+
+def _target_zone_pairs_numpy(freqs, times, freqs_t, times_t, lo, hi) -> Tuple[np.ndarray, np.ndarray]:
+    # Expand every anchor's time window into flat (anchor, candidate) index pairs, then filter by frequency
+    counts = hi - lo
+    anchors = np.repeat(np.arange(len(freqs)), counts)
+    cands = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    hit = np.abs(freqs_t[cands] - freqs[anchors]) < TARGET_ZONE_HEIGHT_FREQ
+    anchors, cands = anchors[hit], cands[hit]
+    anchor_freqs, anchor_times = freqs[anchors].astype(np.int64), times[anchors].astype(np.int64)
+    hashes = _pack_hash(anchor_freqs, freqs_t[cands] - anchor_freqs, times_t[cands] - anchor_times)
+    return hashes, anchor_times
+
+if HAVE_NUMBA:
+    _pack_hash_numba = njit(inline='always')(_pack_hash)
+
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _target_zone_pairs_numba(freqs, times, freqs_t, times_t, lo, hi):
+        n = freqs.size
+        # Count pass, then each anchor fills its own slice, keeping the output in anchor order
+        counts = np.zeros(n + 1, np.int64)
+        for a in prange(n):
+            c = 0
+            for k in range(lo[a], hi[a]):
+                if abs(freqs_t[k] - freqs[a]) < TARGET_ZONE_HEIGHT_FREQ: c += 1
+            counts[a + 1] = c
+        starts = np.cumsum(counts)
+        hashes = np.empty(starts[n], np.int64)
+        anchor_times = np.empty(starts[n], np.int64)
+        for a in prange(n):
+            out = starts[a]
+            for k in range(lo[a], hi[a]):
+                if abs(freqs_t[k] - freqs[a]) < TARGET_ZONE_HEIGHT_FREQ:
+                    f, t = np.int64(freqs[a]), np.int64(times[a])
+                    hashes[out] = _pack_hash_numba(f, freqs_t[k] - f, times_t[k] - t)
+                    anchor_times[out] = times[a]
+                    out += 1
+        return hashes, anchor_times
+
+def _target_zone_pairs(peak_coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (packed hashes, anchor times) for every anchor/target pair, in anchor
+    order. Peaks are indexed by time once, so each anchor only scans the
+    few peaks inside its target time window. Peaks are held as int16 (bins
+    <= 2049, frames ~1300 for 120 s), 4 bytes each instead of 16; deltas
+    stay signed and hashes are packed in int64.
+    """
+    freqs = np.ascontiguousarray(peak_coords[:, 0], dtype=np.int16)
+    times = np.ascontiguousarray(peak_coords[:, 1], dtype=np.int16)
+    order = np.argsort(times, kind='stable')
+    freqs_t, times_t = freqs[order], times[order]
+    lo, hi = _target_windows(times, times_t)
+    pairs = _target_zone_pairs_numba if HAVE_NUMBA else _target_zone_pairs_numpy
+    return pairs(freqs, times, freqs_t, times_t, lo, hi)
+
 class InvariantMatcher(BaseMatcher):
     """
     A self-contained audio matcher using a pitch/tempo-invariant hashing
     algorithm inspired by Panako/Shazam.
     """
 
+    __slots__ = ()
+
+    # Packed 64-bit hash arrays over the 120 s analysis window; earlier versions hashed
+    # SHA-1 keyed dicts, or the whole rest of the file, and never match these
+    fingerprint_key = 'invariant_matcher_v4'
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
 
@@ -35,8 +109,8 @@ class InvariantMatcher(BaseMatcher):
 
     def get_fingerprint(self, path: Path, language: Optional[str] = None) -> Optional[Any]:
         """
-        Generates a fingerprint (a dictionary of relative hash -> anchor time offset)
-        for an audio file.
+        Generates a fingerprint for an audio file: parallel arrays of relative
+        hashes (uint64, sorted) and their anchor time offsets (int32).
         """
         try:
             import librosa
@@ -44,9 +118,8 @@ class InvariantMatcher(BaseMatcher):
             print("ERROR: librosa is not installed. Please run 'pip install librosa'")
             return None
 
-        cache_key = (path, language, "invariant")
-        if hasattr(self, '_fingerprint_cache') and cache_key in self._fingerprint_cache:
-            return self._fingerprint_cache[cache_key]
+        cached = self.cache.get_fingerprint(path, self.fingerprint_key, language)
+        if cached is not None: return cached
 
         duration = get_media_duration(path)
         if not duration: return None
@@ -60,65 +133,61 @@ class InvariantMatcher(BaseMatcher):
 
         audio = extract_audio_segment(path, stream_idx, 22050, start_time=start_time, duration_limit=analysis_duration)
         if audio is None or len(audio) == 0: return None
+        digest = audio_digest(audio)
+        reused = self.cache.get_content_fingerprint(digest, self.fingerprint_key)
+        if reused is not None:
+            self.cache.set_fingerprint(path, self.fingerprint_key, language, reused)
+            return reused
 
         try:
-            spectrogram = np.abs(librosa.stft(
-                audio, n_fft=SPECTROGRAM_FFT_SIZE,
-                hop_length=int(SPECTROGRAM_WINDOW_SIZE * (1 - SPECTROGRAM_OVERLAP_RATIO)),
-                win_length=SPECTROGRAM_WINDOW_SIZE
-            ))
+            fft.use_with_librosa(librosa)
+            with fft.set_workers():
+                stft = librosa.stft(
+                    audio.astype(np.float32, copy=False), n_fft=SPECTROGRAM_FFT_SIZE,
+                    hop_length=int(SPECTROGRAM_WINDOW_SIZE * (1 - SPECTROGRAM_OVERLAP_RATIO)),
+                    win_length=SPECTROGRAM_WINDOW_SIZE, dtype=np.complex64
+                )
         except Exception:
             return None
-
-        local_max = maximum_filter(spectrogram, size=PEAK_NEIGHBORHOOD_SIZE, mode='constant')
-        peaks = (spectrogram == local_max) & (spectrogram > np.median(spectrogram) * 1.5)
+        # float32 magnitudes, and the complex STFT dropped before the memory-bound max filter
+        spectrogram = np.abs(stft, out=np.empty(stft.shape, dtype=np.float32))
+        del stft
+
+        # Square neighbourhood as two separable 1-D passes: O(2W) comparisons per bin, not O(W^2)
+        local_max = maximum_filter1d(spectrogram, PEAK_NEIGHBORHOOD_SIZE, axis=0, mode='constant')
+        local_max = maximum_filter1d(local_max, PEAK_NEIGHBORHOOD_SIZE, axis=1, mode='constant')
+        peaks = (spectrogram == local_max) & (spectrogram > fft.spectrogram_median(spectrogram) * 1.5)
         peak_coords = np.argwhere(peaks)
         if len(peak_coords) < 20: return None
 
-        fingerprint: Dict[str, int] = {}
-        for anchor_freq, anchor_time in peak_coords:
-            start_time_offset = anchor_time + TARGET_ZONE_ANCHOR_DISTANCE_TIME
-            end_time_offset = start_time_offset + TARGET_ZONE_WIDTH_TIME
-
-            targets = peak_coords[
-                (peak_coords[:, 1] >= start_time_offset) &
-                (peak_coords[:, 1] < end_time_offset) &
-                (np.abs(peak_coords[:, 0] - anchor_freq) < TARGET_ZONE_HEIGHT_FREQ)
-            ]
-
-            for target_freq, target_time in targets:
-                # --- INVARIANT HASHING ---
-                # The hash is based on the relative difference in time and frequency
-                # between the anchor and target peaks, not their absolute values.
-                time_delta = target_time - anchor_time
-                freq_delta = target_freq - anchor_freq
+        # --- INVARIANT HASHING ---
+        # The hash is based on the relative difference in time and frequency
+        # between the anchor and target peaks, not their absolute values.
+        hashes, anchor_times = _target_zone_pairs(peak_coords)
+        if not len(hashes): return None
+        # One entry per hash, the latest anchor winning; unique on the reversed
+        # arrays keeps each hash's last occurrence and sorts hashes as it goes
+        hashes, last = np.unique(hashes[::-1].view(np.uint64), return_index=True)
+        fingerprint = (hashes, anchor_times[::-1][last].astype(np.int32))
 
-                hash_input = f"{anchor_freq}|{freq_delta}|{time_delta}".encode('utf-8')
-                h = sha1(hash_input).hexdigest()[0:20]
-                fingerprint[h] = anchor_time
-
-        if not hasattr(self, '_fingerprint_cache'):
-            self._fingerprint_cache = {}
-        self._fingerprint_cache[cache_key] = fingerprint
+        self.cache.set_fingerprint(path, self.fingerprint_key, language, fingerprint)
+        self.cache.set_content_fingerprint(digest, self.fingerprint_key, fingerprint)
 
         return fingerprint
 
     def compare_fingerprints(self, fp1: Any, fp2: Any) -> float:
-        """Compares two fingerprints using temporal chaining."""
-        if not isinstance(fp1, dict) or not isinstance(fp2, dict): return 0.0
-
-        matching_hashes = set(fp1.keys()).intersection(set(fp2.keys()))
-        if not matching_hashes: return 0.0
-
-        time_offsets = defaultdict(int)
-        for h in matching_hashes:
-            offset = fp2[h] - fp1[h]
-            time_offsets[offset] += 1
+        """Compares two fingerprints using temporal chaining: a sorted-array intersection, then a bincount of offsets."""
+        if not isinstance(fp1, (tuple, dict)) or not isinstance(fp2, (tuple, dict)): return 0.0
+        return float(pair_score(*as_arrays(fp1), *as_arrays(fp2)))
 
-        if not time_offsets: return 0.0
+    def compare_fingerprints_matrix(self, ref_fps: List[Tuple[np.ndarray, np.ndarray]], remux_fps: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """Scores every (ref, remux) pair at once; equivalent to compare_fingerprints per pair."""
+        return compare_fingerprints_matrix(ref_fps, remux_fps)
 
-        best_chain_length = max(time_offsets.values())
-        total_hashes = min(len(fp1), len(fp2))
-        confidence = best_chain_length / total_hashes if total_hashes > 0 else 0.0
+    def stack_fingerprints(self, fps: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Contiguous CSR (hashes, offsets, bounds) form of a fingerprint list, for compare_stacked."""
+        return fingerprints_to_arrays(fps)
 
-        return confidence
+    def compare_stacked(self, ref_stack, remux_stack) -> np.ndarray:
+        """(refs x remuxes) scores between two stack_fingerprints results."""
+        return compare_stacked(ref_stack, remux_stack)
@@ -7,11 +7,16 @@ import librosa
 from pathlib import Path
 from typing import Tuple, Optional
 from core.matcher import BaseMatcher
+from utils import fft
 from utils.media import extract_audio_segment, get_media_duration
 
+fft.use_with_librosa(librosa)
+
 class MFCCMatcher(BaseMatcher):
     """Lightweight MFCC-based audio matching"""
 
+    __slots__ = ()
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
 
@@ -48,17 +53,22 @@ class MFCCMatcher(BaseMatcher):
                 return None
 
         try:
-            mfccs = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13)
-            features = np.mean(mfccs, axis=1)
+            # float32 input keeps the STFT in complex64; dtype sets the mel basis to match
+            audio = audio.astype(np.float32, copy=False)
+            mfccs = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13, dtype=np.float32)
+            # Mean and spread of each coefficient over time
+            features = self._unit_vector(np.concatenate([mfccs.mean(axis=1), mfccs.std(axis=1)]))
             self.cache.set_mfcc(path, stream_idx, features)
             return features
         except Exception:
             return None
 
+    def _unit_vector(self, features: np.ndarray) -> np.ndarray:
+        # Cached normalised as float32, so each compare is a single dot product
+        norm = np.linalg.norm(features)
+        if norm == 0: return np.zeros(len(features), dtype=np.float32)
+        return (features / norm).astype(np.float32)
+
     def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
-        # ... (method is unchanged) ...
-        dot_product = np.dot(a, b)
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-        if norm_a == 0 or norm_b == 0: return 0.0
-        return float(dot_product / (norm_a * norm_b))
+        # Both vectors come from _unit_vector; a zero vector scores 0.0
+        return float(np.dot(a, b))
@@ -0,0 +1,117 @@
+# ===========================================
+# matchers/audio/offset_hash.py
+# ===========================================
+"""
+Batch scoring for hash -> time offset fingerprints (PeakMatcher,
+InvariantMatcher). Score is the largest group of shared hashes agreeing on
+one time offset, over the smaller fingerprint's hash count. Fingerprints
+are parallel (sorted uint64 packed hashes, offsets) arrays; hex-keyed
+dicts from SHA-1 era caches are still accepted.
+"""
+
+import hashlib
+import numpy as np
+from typing import Dict, List, Tuple, Union
+
+Fingerprint = Union[Dict[str, int], Tuple[np.ndarray, np.ndarray]]
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+def audio_digest(audio: np.ndarray) -> str:
+    """
+    Digest of decoded samples. A remux that kept the audio stream decodes to
+    the same bytes, so its fingerprint can be reused; near matches are not
+    (episodes share intros and themes).
+    """
+    return hashlib.blake2b(memoryview(np.ascontiguousarray(audio)), digest_size=16).hexdigest()
+
+def as_arrays(fp: Fingerprint) -> Tuple[np.ndarray, np.ndarray]:
+    """(uint64 hashes sorted ascending, int64 offsets) of either fingerprint form; dict keys read as their first 64 bits"""
+    if isinstance(fp, tuple):
+        return np.asarray(fp[0], dtype=np.uint64), np.asarray(fp[1], dtype=np.int64)
+    h = np.fromiter((int(key[:16], 16) for key in fp), dtype=np.uint64, count=len(fp))
+    t = np.fromiter(fp.values(), dtype=np.int64, count=len(fp))
+    order = np.argsort(h, kind='stable')
+    return h[order], t[order]
+
+def fingerprints_to_arrays(fps: List[Fingerprint]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Packs fingerprints CSR-style: per-fingerprint runs of uint64 hashes
+    sorted ascending, their int64 offsets, and (n + 1) run boundaries.
+    """
+    hashes, offsets = [], []
+    bounds = np.zeros(len(fps) + 1, dtype=np.int64)
+    for k, fp in enumerate(fps):
+        h, t = as_arrays(fp)
+        hashes.append(h)
+        offsets.append(t)
+        bounds[k + 1] = bounds[k] + len(h)
+    if not fps:
+        return np.zeros(0, np.uint64), np.zeros(0, np.int64), bounds
+    return np.concatenate(hashes), np.concatenate(offsets), bounds
+
+def pair_score(h1, t1, h2, t2) -> float:
+    """Offset-chain score of two (sorted hashes, offsets) fingerprints"""
+    n = min(len(h1), len(h2))
+    if n == 0: return 0.0
+    _, i1, i2 = np.intersect1d(h1, h2, assume_unique=True, return_indices=True)
+    if len(i1) == 0: return 0.0
+    # Offsets span a few thousand frames, so a bincount beats sorting them
+    deltas = t2[i2] - t1[i1]
+    return np.bincount(deltas - deltas.min()).max() / n
+
+if HAVE_NUMBA:
+    @njit(cache=True, boundscheck=False)
+    def _pair_score_numba(h1, t1, h2, t2):
+        n = min(h1.size, h2.size)
+        if n == 0: return 0.0
+        diffs = np.empty(n, np.int64)
+        a, b, m = 0, 0, 0
+        while a < h1.size and b < h2.size:
+            if h1[a] < h2[b]:
+                a += 1
+            elif h1[a] > h2[b]:
+                b += 1
+            else:
+                diffs[m] = t2[b] - t1[a]
+                m += 1; a += 1; b += 1
+        if m == 0: return 0.0
+        diffs = np.sort(diffs[:m])
+        best, run = 1, 1
+        for k in range(1, m):
+            run = run + 1 if diffs[k] == diffs[k - 1] else 1
+            if run > best: best = run
+        return best / n
+
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _compare_all_numba(ref_h, ref_t, ref_b, rem_h, rem_t, rem_b):
+        n_refs, n_rems = ref_b.size - 1, rem_b.size - 1
+        scores = np.zeros((n_refs, n_rems))
+        for j in prange(n_rems):
+            h2, t2 = rem_h[rem_b[j]:rem_b[j + 1]], rem_t[rem_b[j]:rem_b[j + 1]]
+            for i in range(n_refs):
+                scores[i, j] = _pair_score_numba(ref_h[ref_b[i]:ref_b[i + 1]], ref_t[ref_b[i]:ref_b[i + 1]], h2, t2)
+        return scores
+
+def compare_stacked(ref_stack: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                    remux_stack: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    """(refs x remuxes) offset-chain scores between two fingerprints_to_arrays results"""
+    ref_h, ref_t, ref_b = ref_stack
+    rem_h, rem_t, rem_b = remux_stack
+    n_refs, n_rems = len(ref_b) - 1, len(rem_b) - 1
+    if HAVE_NUMBA:
+        return _compare_all_numba(ref_h, ref_t, ref_b, rem_h, rem_t, rem_b)
+    scores = np.zeros((n_refs, n_rems))
+    for j in range(n_rems):
+        h2, t2 = rem_h[rem_b[j]:rem_b[j + 1]], rem_t[rem_b[j]:rem_b[j + 1]]
+        for i in range(n_refs):
+            scores[i, j] = pair_score(ref_h[ref_b[i]:ref_b[i + 1]], ref_t[ref_b[i]:ref_b[i + 1]], h2, t2)
+    return scores
+
+def compare_fingerprints_matrix(ref_fps: List[Fingerprint], remux_fps: List[Fingerprint]) -> np.ndarray:
+    """(refs x remuxes) offset-chain scores for every pair at once"""
+    return compare_stacked(fingerprints_to_arrays(ref_fps), fingerprints_to_arrays(remux_fps))
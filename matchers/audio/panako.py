@@ -2,23 +2,50 @@
 # matchers/audio/panako.py
 # ===========================================
 
+import csv
+import io
 import os
 import shutil
 import tempfile
+import threading
 import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Optional, Dict, List, Any
+from typing import Iterable, Tuple, Optional, Dict, List, Any
 from core.matcher import BaseMatcher
-from utils.media import extract_audio_to_wav
+from utils.media import get_or_extract_wav
+
+# Panako's CLI has no command loop to keep one JVM alive across files, so every store/query is
+# a fresh JVM: C1-only JIT, the serial collector and class-data sharing cut its startup cost
+JVM_STARTUP_FLAGS = ['-XX:TieredStopAtLevel=1', '-XX:+UseSerialGC', '-Xshare:auto']
+# Seconds one store or query of a single file may take
+PANAKO_TIMEOUT = 60
 
 class PanakoMatcher(BaseMatcher):
     """Panako integration using the two-step batch process."""
 
+    __slots__ = ('panako_jar', 'panako_work_dir', 'scratch_dir', '_prefetched', '_wav_dir', '_wav_dir_lock')
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
         self.panako_jar = self.config.get('panako_jar')
         self.panako_work_dir = self.app_data_dir / "panako"
         self.panako_work_dir.mkdir(exist_ok=True)
+        # Per-file WAVs and DBs are written once, read once and deleted: keep them in tmpfs when there is one
+        shm = Path('/dev/shm')
+        self.scratch_dir = shm if shm.is_dir() and os.access(shm, os.W_OK) else self.panako_work_dir
+        # Extracted WAVs, shared by prefetch and get_fingerprint until stop()
+        self._wav_dir: Optional[Path] = None
+        self._wav_dir_lock = threading.Lock()
+        # Self-query results from prefetch, keyed by (path, language)
+        self._prefetched: Dict[Tuple[Path, Optional[str]], Optional[Dict]] = {}
+
+    def stop(self):
+        super().stop()
+        with self._wav_dir_lock:
+            if self._wav_dir: shutil.rmtree(self._wav_dir, ignore_errors=True)
+            self._wav_dir = None
 
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         # This method is not used by the new pipeline logic but is kept for compatibility
@@ -29,14 +56,52 @@ class PanakoMatcher(BaseMatcher):
         score = self.compare_fingerprints(ref_fp, remux_fp)
         return score, f"Panako similarity {score:.1%}"
 
+    def prefetch(self, paths: Iterable[Path], language: Optional[str] = None, max_workers: Optional[int] = None):
+        """
+        Fingerprints every path with one store and one query JVM instead of
+        two per file: all WAVs go into one shared DB, and each file's result
+        is kept only from the lines matching itself, as a per-file DB gives.
+        """
+        if not self.panako_jar or not Path(self.panako_jar).exists():
+            return
+        paths = [path for path in dict.fromkeys(paths) if (path, language) not in self._prefetched]
+        if not paths: return
+
+        with tempfile.TemporaryDirectory(prefix="panako_batch_", dir=self.scratch_dir) as temp_dir_str:
+            temp_dir = Path(temp_dir_str)
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, thread_name_prefix="panako-wav") as pool:
+                wavs = dict(zip(paths, pool.map(lambda path: self._prepare_wav(path, language), paths)))
+            wavs = {path: wav for path, wav in wavs.items() if wav}
+            if not wavs or not self._running: return
+
+            wav_args = [str(wav) for wav in wavs.values()]
+            # One JVM does every file's work, so allow each file the per-file timeout
+            timeout = PANAKO_TIMEOUT * len(wav_args)
+            if not self._run_panako_cmd(temp_dir, ['store', 'STRATEGY=panako', *wav_args], timeout=timeout): return
+            output = self._run_panako_cmd(temp_dir, ['query', 'STRATEGY=panako', *wav_args], capture=True, timeout=timeout)
+            if output is None: return
+            lines = output.splitlines()
+            for path, wav in wavs.items():
+                own = [line for line in lines if self._is_self_match(line, wav)]
+                # No self-match means the batch lost this file; leave it to get_fingerprint
+                if own:
+                    self._prefetched[(path, language)] = self._parse_panako_output('\n'.join(own))
+
+    @staticmethod
+    def _is_self_match(line: str, wav: Path) -> bool:
+        parts = [p.strip() for p in line.split(";")]
+        return len(parts) >= 13 and Path(parts[2]).name == wav.name and Path(parts[5]).name == wav.name
+
     def get_fingerprint(self, path: Path, language: Optional[str] = None) -> Optional[Any]:
         """Generates a Panako fingerprint by creating and querying a temporary DB."""
         if not self.panako_jar or not Path(self.panako_jar).exists():
             return None
+        if (path, language) in self._prefetched:
+            return self._prefetched[(path, language)]
 
-        with tempfile.TemporaryDirectory(prefix="panako_fp_", dir=self.panako_work_dir) as temp_dir_str:
+        with tempfile.TemporaryDirectory(prefix="panako_fp_", dir=self.scratch_dir) as temp_dir_str:
             temp_dir = Path(temp_dir_str)
-            wav = self._prepare_wav(path, language, temp_dir, "fp_wav")
+            wav = self._prepare_wav(path, language)
             if not wav: return None
 
             # Store the wav to create a fingerprint/DB entry for it
@@ -68,18 +133,22 @@ class PanakoMatcher(BaseMatcher):
             return 1.0 - abs(fp1['match_score'] - fp2['match_score']) / max(fp1['match_score'], fp2['match_score'], 1)
         return 0.0
 
-    def _prepare_wav(self, path: Path, language: Optional[str], work_dir: Path, prefix: str) -> Optional[Path]:
+    def _prepare_wav(self, path: Path, language: Optional[str]) -> Optional[Path]:
         stream_idx = self.get_audio_stream_index(path, language)
         if stream_idx is None: return None
-        wav_path = work_dir / f"{prefix}_{path.stem}.wav"
-        if extract_audio_to_wav(path, stream_idx, wav_path, sample_rate=22050):
-            return wav_path
-        return None
+        return get_or_extract_wav(path, stream_idx, 22050, self._get_wav_dir())
+
+    def _get_wav_dir(self) -> Path:
+        with self._wav_dir_lock:
+            if self._wav_dir is None:
+                self._wav_dir = Path(tempfile.mkdtemp(prefix="panako_wavs_", dir=self.scratch_dir))
+            return self._wav_dir
 
-    def _run_panako_cmd(self, work_dir: Path, args: List[str], capture: bool = False) -> Optional[str]:
+    def _run_panako_cmd(self, work_dir: Path, args: List[str], capture: bool = False,
+                        timeout: float = PANAKO_TIMEOUT) -> Optional[str]:
         try:
-            cmd = ['java', f'-Duser.home={work_dir}', '--add-opens=java.base/java.nio=ALL-UNNAMED', '-jar', str(self.panako_jar), *args]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            cmd = ['java', *JVM_STARTUP_FLAGS, f'-Duser.home={work_dir}', '--add-opens=java.base/java.nio=ALL-UNNAMED', '-jar', str(self.panako_jar), *args]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
 
             if capture:
                 return result.stdout if result.returncode == 0 else None
@@ -88,17 +157,27 @@ class PanakoMatcher(BaseMatcher):
             return None
 
     def _parse_panako_output(self, output: str) -> Optional[Dict]:
-        best_result = None
-        for line in output.splitlines():
-            if ';' not in line: continue
-            parts = [p.strip() for p in line.split(";")]
-            if len(parts) < 13: continue
-            try:
-                score = int(float(parts[9]))
-                seconds_ratio = float(parts[12].replace("%", "")) / 100.0
-                current_result = {"match_score": score, "seconds_ratio": seconds_ratio}
-                if best_result is None or current_result["seconds_ratio"] > best_result["seconds_ratio"]:
-                    best_result = current_result
-            except (ValueError, IndexError):
-                continue
-        return best_result
+        """Best result line by seconds-with-match ratio, the numeric columns parsed in bulk"""
+        rows = [r for r in csv.reader(io.StringIO(output), delimiter=';') if len(r) >= 13]
+        if not rows: return None
+        try:
+            scores, ratios = self._numeric_columns(rows)
+        except ValueError:
+            # Some line has a non-numeric field; drop those like the per-line parser did
+            rows = [r for r in rows if self._is_numeric(r[9]) and self._is_numeric(r[12].replace("%", ""))]
+            if not rows: return None
+            scores, ratios = self._numeric_columns(rows)
+        best = int(np.argmax(ratios))
+        return {"match_score": int(scores[best]), "seconds_ratio": float(ratios[best])}
+
+    @staticmethod
+    def _numeric_columns(rows: List[List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.asarray([r[9] for r in rows], dtype=float)
+        ratios = np.asarray([r[12].replace("%", "") for r in rows], dtype=float) / 100.0
+        return scores, ratios
+
+    @staticmethod
+    def _is_numeric(field: str) -> bool:
+        try: float(field)
+        except ValueError: return False
+        return True
@@ -4,29 +4,101 @@
 
 import numpy as np
 from scipy.ndimage import maximum_filter
-from hashlib import sha1
 from pathlib import Path
-from typing import Tuple, Optional, Any, Set, Dict
-from collections import defaultdict
+from typing import Tuple, Optional, Any, List
 
 from core.matcher import BaseMatcher
+from .offset_hash import as_arrays, audio_digest, compare_fingerprints_matrix, compare_stacked, fingerprints_to_arrays, pair_score
+from utils import fft
 from utils.media import get_media_duration, extract_audio_segment
 
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
 # --- Constants for the algorithm ---
-SPECTROGRAM_FFT_SIZE = 4096
-SPECTROGRAM_WINDOW_SIZE = 4096
+# TV audio carries little above 5 kHz; at half the old rate and FFT size the bins and hops
+# keep their width in Hz and seconds, so the peak and target-zone constants are unchanged
+SAMPLE_RATE = 11025
+SPECTROGRAM_FFT_SIZE = 2048
+SPECTROGRAM_WINDOW_SIZE = 2048
 SPECTROGRAM_OVERLAP_RATIO = 0.5
 PEAK_NEIGHBORHOOD_SIZE = 20
 TARGET_ZONE_ANCHOR_DISTANCE_TIME = 10
 TARGET_ZONE_HEIGHT_FREQ = 200
 TARGET_ZONE_WIDTH_TIME = 60
 
+def _pack_hash(freq1, freq2, time_delta):
+    """freq1 << 40 | freq2 << 20 | time_delta; an exact key where the old SHA-1 prefix only approximated one"""
+    return (freq1 << 40) | (freq2 << 20) | time_delta
+
+def _peak_pairs_numpy(freqs, times, freqs_t, times_t, lo, hi) -> Tuple[np.ndarray, np.ndarray]:
+    # Expand every anchor's time window into flat (anchor, target) index pairs, then filter by frequency
+    counts = hi - lo
+    anchors = np.repeat(np.arange(len(freqs)), counts)
+    targets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    hit = np.abs(freqs_t[targets] - freqs[anchors]) < TARGET_ZONE_HEIGHT_FREQ
+    anchors, targets = anchors[hit], targets[hit]
+    anchor_times = times[anchors].astype(np.int64)
+    hashes = _pack_hash(freqs[anchors].astype(np.int64), freqs_t[targets].astype(np.int64), times_t[targets] - anchor_times)
+    return hashes, anchor_times
+
+if HAVE_NUMBA:
+    _pack_hash_numba = njit(inline='always')(_pack_hash)
+
+    @njit(parallel=True, cache=True, boundscheck=False)
+    def _peak_pairs_numba(freqs, times, freqs_t, times_t, lo, hi):
+        n = freqs.size
+        # Count pass, then each anchor fills its own slice, keeping the output in anchor order
+        counts = np.zeros(n + 1, np.int64)
+        for a in prange(n):
+            c = 0
+            for k in range(lo[a], hi[a]):
+                if abs(freqs_t[k] - freqs[a]) < TARGET_ZONE_HEIGHT_FREQ: c += 1
+            counts[a + 1] = c
+        starts = np.cumsum(counts)
+        hashes = np.empty(starts[n], np.int64)
+        anchor_times = np.empty(starts[n], np.int64)
+        for a in prange(n):
+            out = starts[a]
+            for k in range(lo[a], hi[a]):
+                if abs(freqs_t[k] - freqs[a]) < TARGET_ZONE_HEIGHT_FREQ:
+                    hashes[out] = _pack_hash_numba(np.int64(freqs[a]), np.int64(freqs_t[k]), np.int64(times_t[k] - times[a]))
+                    anchor_times[out] = times[a]
+                    out += 1
+        return hashes, anchor_times
+
+def _peak_pairs(peaks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (packed hashes, anchor times) for every anchor/target pair of a boolean
+    peak mask, in anchor (frequency-major) order. Peaks are read straight
+    into separate int32 frequency and time arrays and sorted by time once;
+    each anchor's target window is a searchsorted range, scanned by a
+    parallel JIT kernel or expanded for all anchors at once in NumPy.
+    """
+    freqs, times = (a.astype(np.int32) for a in np.nonzero(peaks))
+    order = np.argsort(times, kind='stable')
+    freqs_t, times_t = freqs[order], times[order]
+    t0 = times + TARGET_ZONE_ANCHOR_DISTANCE_TIME
+    lo = np.searchsorted(times_t, t0, side='left')
+    hi = np.searchsorted(times_t, t0 + TARGET_ZONE_WIDTH_TIME, side='left')
+    pairs = _peak_pairs_numba if HAVE_NUMBA else _peak_pairs_numpy
+    return pairs(freqs, times, freqs_t, times_t, lo, hi)
+
 class PeakMatcher(BaseMatcher):
     """
     A self-contained audio matcher inspired by Panako/Shazam, using peak-finding,
     combinatorial hashing, and temporal chaining for accuracy.
     """
 
+    __slots__ = ()
+
+    # Packed 64-bit hash arrays over the 120 s analysis window at 11025 Hz; earlier versions
+    # ran at 22050 Hz, hashed SHA-1 keyed dicts, or the whole rest of the file, and never match these
+    fingerprint_key = 'peak_matcher_v4'
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
 
@@ -34,16 +106,12 @@ class PeakMatcher(BaseMatcher):
         raise NotImplementedError("PeakMatcher should be used via the batch pipeline.")
 
     def get_fingerprint(self, path: Path, language: Optional[str] = None) -> Optional[Any]:
-        """Generates a fingerprint (a dictionary of hash -> time offset) for an audio file."""
-        try:
-            import librosa
-        except ImportError:
-            print("ERROR: librosa is not installed. Please run 'pip install librosa'")
-            return None
-
-        cache_key = (path, language)
-        if hasattr(self, '_fingerprint_cache') and cache_key in self._fingerprint_cache:
-            return self._fingerprint_cache[cache_key]
+        """
+        Generates a fingerprint for an audio file: parallel arrays of packed
+        peak-pair hashes (uint64, sorted) and their anchor time offsets (int32).
+        """
+        cached = self.cache.get_fingerprint(path, self.fingerprint_key, language)
+        if cached is not None: return cached
 
         duration = get_media_duration(path)
         if not duration: return None
@@ -55,75 +123,54 @@ class PeakMatcher(BaseMatcher):
         start_time = duration * start_percent
         analysis_duration = 120
 
-        audio = extract_audio_segment(path, stream_idx, 22050, start_time=start_time, duration_limit=analysis_duration)
+        audio = extract_audio_segment(path, stream_idx, SAMPLE_RATE, start_time=start_time, duration_limit=analysis_duration)
         if audio is None or len(audio) == 0: return None
+        digest = audio_digest(audio)
+        reused = self.cache.get_content_fingerprint(digest, self.fingerprint_key)
+        if reused is not None:
+            self.cache.set_fingerprint(path, self.fingerprint_key, language, reused)
+            return reused
 
         try:
-            spectrogram = np.abs(librosa.stft(
-                audio, n_fft=SPECTROGRAM_FFT_SIZE,
-                hop_length=int(SPECTROGRAM_WINDOW_SIZE * (1 - SPECTROGRAM_OVERLAP_RATIO)),
-                win_length=SPECTROGRAM_WINDOW_SIZE
-            ))
+            spectrogram = fft.magnitude_spectrogram(
+                audio, SPECTROGRAM_FFT_SIZE, int(SPECTROGRAM_WINDOW_SIZE * (1 - SPECTROGRAM_OVERLAP_RATIO))
+            )
         except Exception as e:
             print(f"Error creating spectrogram for {path.name}: {e}")
             return None
 
         local_max = maximum_filter(spectrogram, size=PEAK_NEIGHBORHOOD_SIZE, mode='constant')
-        peaks = (spectrogram == local_max) & (spectrogram > np.median(spectrogram) * 1.5)
-        peak_coords = np.argwhere(peaks)
-        if len(peak_coords) < 10: return None
-
-        # The fingerprint is now a dictionary mapping a hash to its absolute time offset
-        fingerprint: Dict[str, int] = {}
-        for freq1, time1 in peak_coords:
-            start_time_offset = time1 + TARGET_ZONE_ANCHOR_DISTANCE_TIME
-            end_time_offset = start_time_offset + TARGET_ZONE_WIDTH_TIME
-
-            targets = peak_coords[
-                (peak_coords[:, 1] >= start_time_offset) &
-                (peak_coords[:, 1] < end_time_offset) &
-                (np.abs(peak_coords[:, 0] - freq1) < TARGET_ZONE_HEIGHT_FREQ)
-            ]
-
-            for freq2, time2 in targets:
-                time_delta = time2 - time1
-                hash_input = f"{freq1}|{freq2}|{time_delta}".encode('utf-8')
-                h = sha1(hash_input).hexdigest()[0:20]
-                fingerprint[h] = time1
-
-        if not hasattr(self, '_fingerprint_cache'):
-            self._fingerprint_cache = {}
-        self._fingerprint_cache[cache_key] = fingerprint
+        peaks = (spectrogram == local_max) & (spectrogram > fft.spectrogram_median(spectrogram) * 1.5)
+        if np.count_nonzero(peaks) < 10: return None
+
+        hashes, anchor_times = _peak_pairs(peaks)
+        if not len(hashes): return None
+        # One entry per hash, the latest anchor winning as the old dict did; unique
+        # on the reversed arrays keeps each hash's last occurrence and sorts hashes
+        hashes, last = np.unique(hashes[::-1].view(np.uint64), return_index=True)
+        fingerprint = (hashes, anchor_times[::-1][last].astype(np.int32))
+
+        self.cache.set_fingerprint(path, self.fingerprint_key, language, fingerprint)
+        self.cache.set_content_fingerprint(digest, self.fingerprint_key, fingerprint)
 
         return fingerprint
 
     def compare_fingerprints(self, fp1: Any, fp2: Any) -> float:
         """
-        Compares two fingerprints using temporal chaining to find the most consistent
-        sequence of matching hashes.
+        Compares two fingerprints using temporal chaining: the most hashes
+        sharing one time offset, over the smaller fingerprint's hash count.
         """
-        if not isinstance(fp1, dict) or not isinstance(fp2, dict): return 0.0
-
-        # Find the hashes that exist in both fingerprints
-        matching_hashes = set(fp1.keys()).intersection(set(fp2.keys()))
-        if not matching_hashes: return 0.0
-
-        # For each matching hash, calculate the time offset between the two files
-        # offset = (time in file 2) - (time in file 1)
-        time_offsets = defaultdict(int)
-        for h in matching_hashes:
-            offset = fp2[h] - fp1[h]
-            time_offsets[offset] += 1
-
-        if not time_offsets: return 0.0
+        if not isinstance(fp1, (tuple, dict)) or not isinstance(fp2, (tuple, dict)): return 0.0
+        return float(pair_score(*as_arrays(fp1), *as_arrays(fp2)))
 
-        # The best match is the one with the most hashes sharing the same time offset.
-        # This is our "chain".
-        best_chain_length = max(time_offsets.values())
+    def compare_fingerprints_matrix(self, ref_fps: List[Tuple[np.ndarray, np.ndarray]], remux_fps: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """Scores every (ref, remux) pair at once; equivalent to compare_fingerprints per pair."""
+        return compare_fingerprints_matrix(ref_fps, remux_fps)
 
-        # The confidence is the ratio of the longest chain to the total number of hashes
-        # in the smaller fingerprint. This measures how much of the file aligns correctly.
-        total_hashes = min(len(fp1), len(fp2))
-        confidence = best_chain_length / total_hashes if total_hashes > 0 else 0.0
+    def stack_fingerprints(self, fps: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Contiguous CSR (hashes, offsets, bounds) form of a fingerprint list, for compare_stacked."""
+        return fingerprints_to_arrays(fps)
 
-        return confidence
+    def compare_stacked(self, ref_stack, remux_stack) -> np.ndarray:
+        """(refs x remuxes) scores between two stack_fingerprints results."""
+        return compare_stacked(ref_stack, remux_stack)
@@ -2,88 +2,147 @@
 # matchers/video/phash.py
 # ===========================================
 
+import functools
+import multiprocessing
+import os
 import numpy as np
 import imagehash
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Tuple, Optional, List
+from typing import Iterable, Tuple, Optional
 from core.matcher import BaseMatcher
 from utils.media import extract_frames
 
+# 16x16 pHash + 16x16 dHash, packed as 4 + 4 uint64 words per frame
+HASH_BITS = 256
+HASH_WORDS = 2 * HASH_BITS // 64
+
+def _pack_hash(h: imagehash.ImageHash) -> np.ndarray:
+    return np.packbits(h.hash.ravel()).view(np.uint64)
+
+if hasattr(np, 'bitwise_count'):
+    def _row_bits(x: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(x).sum(axis=1)
+else:
+    def _row_bits(x: np.ndarray) -> np.ndarray:
+        return np.unpackbits(x.view(np.uint8), axis=1).sum(axis=1)
+
+def _hash_frames(path: Path, duration: float, edge_skip_percent: float) -> np.ndarray:
+    """
+    (frames, HASH_WORDS) uint64 rows of packed pHash then dHash bits for 25
+    frames across the middle of the file; module level so worker processes
+    can run it.
+    """
+    n_frames = 25
+    # Ensure skip is not more than 40% to leave a valid middle section
+    edge_skip = min(edge_skip_percent, 0.4)
+
+    start = duration * edge_skip
+    end = duration * (1 - edge_skip)
+
+    # Ensure start is not after end for very short files
+    if start >= end:
+        start = 0
+        end = duration
+
+    timestamps = np.linspace(start, end, n_frames)
+    hashes = []
+
+    for frame in extract_frames(path, list(timestamps)) or []:
+        try:
+            img = Image.fromarray(frame)
+            ph = imagehash.phash(img, hash_size=16)
+            dh = imagehash.dhash(img, hash_size=16)
+            hashes.append(np.concatenate((_pack_hash(ph), _pack_hash(dh))))
+        except Exception: continue
+    return np.array(hashes).reshape(-1, HASH_WORDS)
+
+@functools.lru_cache(maxsize=4096)
+def _compare_packed(bytes1: bytes, bytes2: bytes) -> Tuple[float, int]:
+    """
+    Offset search over two packed hash sequences. Arrays are unhashable, so
+    the cache keys on their bytes; retries and matchers sharing a pair skip
+    the popcount passes.
+    """
+    seq1 = np.frombuffer(bytes1, dtype=np.uint64).reshape(-1, HASH_WORDS)
+    seq2 = np.frombuffer(bytes2, dtype=np.uint64).reshape(-1, HASH_WORDS)
+    best_similarity = 0
+    best_offset = 0
+    for offset in range(-5, 6):
+        if offset >= 0: s1, s2 = seq1[offset:], seq2
+        else: s1, s2 = seq1, seq2[-offset:]
+        min_len = min(len(s1), len(s2))
+        if min_len < 10: continue
+        # Mean of (ph_sim + dh_sim) / 2 over frames is one minus the differing bits over all bits
+        avg_similarity = 1 - _row_bits(s1[:min_len] ^ s2[:min_len]).sum() / (min_len * 2 * HASH_BITS)
+        if avg_similarity > best_similarity:
+            best_similarity = avg_similarity
+            best_offset = offset
+    return best_similarity, best_offset
+
 class PerceptualHashMatcher(BaseMatcher):
     """Improved perceptual hash video matching"""
 
+    __slots__ = ()
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
 
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         ref_hashes = self._get_video_hashes(ref_path)
         remux_hashes = self._get_video_hashes(remux_path)
-        if not ref_hashes or not remux_hashes:
+        if ref_hashes is None or remux_hashes is None:
             return 0.0, "Failed to extract video frames"
         similarity, offset = self._compare_hash_sequences(ref_hashes, remux_hashes)
         info = f"Video pHash, offset={offset}"
         return similarity, info
 
-    def _get_video_hashes(self, path: Path) -> Optional[List]:
-        cached = self.cache.get_video_hashes(path, "phash")
-        if cached: return cached
+    def prefetch(self, paths: Iterable[Path], language: Optional[str] = None, max_workers: Optional[int] = None):
+        """Hashes uncached paths in worker processes (decode and DCT work is GIL-bound); results are cached here."""
+        jobs = {}
+        for path in dict.fromkeys(paths):
+            if self.cache.get_video_hashes(path, "phash") is not None: continue
+            duration = self._get_duration(path)
+            if duration: jobs[path] = duration
+        workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+        if workers <= 1:
+            for path in jobs:
+                if self._running: self._get_video_hashes(path)
+            return
 
-        n_frames = 25
+        edge_skip_percent = self.config.get('analysis_start_percent', 15) / 100.0
+        # spawn, not fork: the GUI process has Qt and pool threads running
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_hash_frames, path, duration, edge_skip_percent): path for path, duration in jobs.items()}
+            for future in as_completed(futures):
+                if not self._running:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return
+                hashes = future.result()
+                if len(hashes): self.cache.set_video_hashes(futures[future], "phash", hashes)
+
+    def _get_duration(self, path: Path) -> Optional[float]:
         duration = self.cache.get_duration(path)
         if not duration:
             from utils.media import get_media_duration
             duration = get_media_duration(path)
             if duration: self.cache.set_duration(path, duration)
-            else: return None
+        return duration
 
-        # --- MODIFICATION: Use percentage from config ---
-        edge_skip_percent = self.config.get('analysis_start_percent', 15) / 100.0
-        # Ensure skip is not more than 40% to leave a valid middle section
-        edge_skip = min(edge_skip_percent, 0.4)
-        # --- END MODIFICATION ---
-
-        start = duration * edge_skip
-        end = duration * (1 - edge_skip)
-
-        # Ensure start is not after end for very short files
-        if start >= end:
-            start = 0
-            end = duration
-
-        timestamps = np.linspace(start, end, n_frames)
-        hashes = []
-
-        for ts in timestamps:
-            frame = extract_frames(path, [ts])
-            if frame:
-                try:
-                    img = Image.fromarray(frame[0])
-                    ph = imagehash.phash(img, hash_size=16)
-                    dh = imagehash.dhash(img, hash_size=16)
-                    hashes.append((str(ph), str(dh)))
-                except Exception: continue
-
-        if hashes: self.cache.set_video_hashes(path, "phash", hashes)
+    def _get_video_hashes(self, path: Path) -> Optional[np.ndarray]:
+        cached = self.cache.get_video_hashes(path, "phash")
+        if cached is not None: return cached
+
+        duration = self._get_duration(path)
+        if not duration: return None
+
+        hashes = _hash_frames(path, duration, self.config.get('analysis_start_percent', 15) / 100.0)
+
+        if len(hashes): self.cache.set_video_hashes(path, "phash", hashes)
         return hashes if len(hashes) > 10 else None
 
-    def _compare_hash_sequences(self, seq1: List, seq2: List) -> Tuple[float, int]:
-        # ... (method is unchanged) ...
-        best_similarity = 0
-        best_offset = 0
-        for offset in range(-5, 6):
-            if offset >= 0: s1, s2 = seq1[offset:], seq2
-            else: s1, s2 = seq1, seq2[-offset:]
-            min_len = min(len(s1), len(s2))
-            if min_len < 10: continue
-            s1, s2 = s1[:min_len], s2[:min_len]
-            similarities = []
-            for (ph1, dh1), (ph2, dh2) in zip(s1, s2):
-                ph_sim = 1 - (bin(int(ph1, 16) ^ int(ph2, 16)).count('1') / (len(ph1) * 4))
-                dh_sim = 1 - (bin(int(dh1, 16) ^ int(dh2, 16)).count('1') / (len(dh1) * 4))
-                similarities.append((ph_sim + dh_sim) / 2)
-            avg_similarity = np.mean(similarities)
-            if avg_similarity > best_similarity:
-                best_similarity = avg_similarity
-                best_offset = offset
-        return best_similarity, best_offset
+    def _compare_hash_sequences(self, seq1: np.ndarray, seq2: np.ndarray) -> Tuple[float, int]:
+        """Best mean pHash/dHash similarity over frame offsets -5..5, memoized on the hash bytes"""
+        return _compare_packed(np.ascontiguousarray(seq1, dtype=np.uint64).tobytes(),
+                               np.ascontiguousarray(seq2, dtype=np.uint64).tobytes())
@@ -2,68 +2,117 @@
 # matchers/video/scene.py
 # ===========================================
 
+import multiprocessing
+import os
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Tuple, Optional, List
+from typing import Iterable, Tuple, Optional
 from core.matcher import BaseMatcher
-from scenedetect import open_video, SceneManager
-from scenedetect.detectors import ContentDetector
+from utils.dtw import banded_dtw, fast_dtw
+
+# OpenCV decodes with its own threads, so scene detection takes half the cores by default
+SCENE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Band half-width in scenes for the pattern DTW
+SCENE_DTW_BAND = 8
+# Above this many band cells (long lists of very different lengths) FastDTW's
+# O(n * radius) refinement beats filling the exact band
+FAST_DTW_MIN_CELLS = 1_000_000
+
+def _detect_scenes(path: Path) -> Optional[np.ndarray]:
+    """
+    Scene durations in seconds; module-level so worker processes can run it.
+    scenedetect (and OpenCV under it) is imported here, only where detection
+    actually runs, so cached runs and the spawned pool's parent skip it.
+    """
+    try:
+        from scenedetect import open_video, SceneManager
+        from scenedetect.detectors import ContentDetector
+        video = open_video(str(path))
+        scene_manager = SceneManager()
+        scene_manager.add_detector(ContentDetector(threshold=30.0))
+        scene_manager.detect_scenes(video, show_progress=False)
+        scene_list = scene_manager.get_scene_list()
+        return np.fromiter((end.get_seconds() - start.get_seconds() for start, end in scene_list),
+                           dtype=np.float32, count=len(scene_list))
+    except Exception:
+        return None
 
 class SceneDetectionMatcher(BaseMatcher):
     """Scene-based video matching"""
 
+    __slots__ = ('max_count_ratio', 'max_duration_ratio')
+
     def __init__(self, cache, config, app_data_dir: Path):
         super().__init__(cache, config, app_data_dir)
+        # Pairs further apart than this in scene count or total length score 0 without a DTW
+        self.max_count_ratio = config.get('scene_max_count_ratio', 3.0)
+        self.max_duration_ratio = config.get('scene_max_duration_ratio', 1.5)
 
     def compare(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> Tuple[float, str]:
         # ... (rest of file is unchanged) ...
         ref_scenes = self._get_scene_list(ref_path)
         remux_scenes = self._get_scene_list(remux_path)
 
-        if not ref_scenes or not remux_scenes:
+        if ref_scenes is None or remux_scenes is None or not len(ref_scenes) or not len(remux_scenes):
             return 0.0, "Failed to detect scenes"
 
         similarity = self._compare_scene_patterns(ref_scenes, remux_scenes)
         info = f"Scene pattern matching"
         return similarity, info
 
-    def _get_scene_list(self, path: Path) -> Optional[List[float]]:
+    def cheap_score(self, ref_path: Path, remux_path: Path, language: Optional[str] = None) -> float:
+        """Scene-count ratio; the same episode cuts to roughly the same number of scenes"""
+        remux_scenes = self.cache.get_scenes(remux_path)
+        if remux_scenes is None or not len(remux_scenes): return 0.0
+        ref_scenes = self._get_scene_list(ref_path)
+        if ref_scenes is None or not len(ref_scenes): return 0.0
+        return min(len(ref_scenes), len(remux_scenes)) / max(len(ref_scenes), len(remux_scenes))
+
+    def prefetch(self, paths: Iterable[Path], language: Optional[str] = None, max_workers: Optional[int] = None):
+        """Detects scenes for uncached paths in worker processes (the decode loop is mostly GIL-bound); results are cached here."""
+        jobs = [path for path in dict.fromkeys(paths) if self.cache.get_scenes(path) is None]
+        workers = min(max_workers or SCENE_WORKERS, len(jobs))
+        if workers <= 1:
+            for path in jobs:
+                if self._running: self._get_scene_list(path)
+            return
+
+        # spawn, not fork: the GUI process has Qt and pool threads running
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(_detect_scenes, path): path for path in jobs}
+            for future in as_completed(futures):
+                if not self._running:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return
+                durations = future.result()
+                if durations is not None and len(durations): self.cache.set_scenes(futures[future], durations)
+
+    def _get_scene_list(self, path: Path) -> Optional[np.ndarray]:
         cached = self.cache.get_scenes(path)
-        if cached:
+        if cached is not None:
             return cached
 
-        try:
-            video = open_video(str(path))
-            scene_manager = SceneManager()
-            scene_manager.add_detector(ContentDetector(threshold=30.0))
-            scene_manager.detect_scenes(video, show_progress=False)
-            scene_list = scene_manager.get_scene_list()
-            durations = []
-            for start, end in scene_list:
-                durations.append(end.get_seconds() - start.get_seconds())
-            if durations:
-                self.cache.set_scenes(path, durations)
-            return durations
-        except Exception:
-            return None
-
-    def _compare_scene_patterns(self, scenes1: List[float], scenes2: List[float]) -> float:
-        total1, total2 = sum(scenes1), sum(scenes2)
+        durations = _detect_scenes(path)
+        if durations is None or not len(durations): return None
+        return self.cache.set_scenes(path, durations)
+
+    def _compare_scene_patterns(self, scenes1: np.ndarray, scenes2: np.ndarray) -> float:
+        # Cached float32 vectors are used as they are; normalising makes the only copy
+        total1, total2 = scenes1.sum(dtype=np.float64), scenes2.sum(dtype=np.float64)
         if total1 == 0 or total2 == 0:
             return 0.0
+        if max(len(scenes1), len(scenes2)) / min(len(scenes1), len(scenes2)) > self.max_count_ratio: return 0.0
+        if max(total1, total2) / min(total1, total2) > self.max_duration_ratio: return 0.0
+
+        norm1, norm2 = scenes1 / np.float32(total1), scenes2 / np.float32(total2)
 
-        norm1 = [s / total1 for s in scenes1]
-        norm2 = [s / total2 for s in scenes2]
-
-        try:
-            import librosa
-            arr1 = np.array(norm1).reshape(-1, 1)
-            arr2 = np.array(norm2).reshape(-1, 1)
-            D, _ = librosa.sequence.dtw(arr1.T, arr2.T)
-            distance = D[-1, -1]
-            return float(1 / (1 + distance))
-        except ImportError:
-            min_len = min(len(norm1), len(norm2))
-            if min_len < 3: return 0.0
-            correlation = np.corrcoef(norm1[:min_len], norm2[:min_len])[0, 1]
-            return max(0, correlation)
+        # Sakoe-Chiba band: a scene may only align near its own position, and the
+        # band always spans the length difference so the end cell stays reachable
+        band = max(SCENE_DTW_BAND, abs(len(norm1) - len(norm2)))
+        if min(len(norm1), len(norm2)) * (2 * band + 1) >= FAST_DTW_MIN_CELLS:
+            distance = fast_dtw(norm1, norm2)
+        else:
+            distance = banded_dtw(norm1, norm2, band)
+        return float(1 / (1 + distance))
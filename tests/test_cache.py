@@ -0,0 +1,50 @@
+import numpy as np
+
+from core.cache import MediaCache
+
+
+def test_read_only_cache_reads_but_never_writes(tmp_path):
+    media = tmp_path / "a.mkv"
+    media.write_bytes(b"data")
+    db_path = tmp_path / "cache.db"
+    owner = MediaCache(db_path=db_path)
+    fingerprint = (np.array([1, 2, 3], dtype=np.uint64), np.array([0, 5, 9], dtype=np.int32))
+    owner.set_fingerprint(media, 'peak_matcher_v4', None, fingerprint)
+
+    worker = MediaCache(db_path=db_path, db_read_only=True)
+    hashes, offsets = worker.get_fingerprint(media, 'peak_matcher_v4', None)
+    assert hashes.tolist() == [1, 2, 3] and offsets.tolist() == [0, 5, 9]
+
+    # Writes stay in the worker's memory; the parent's store is untouched
+    worker.set_fingerprint(media, 'invariant_matcher_v4', None, fingerprint)
+    assert worker.get_fingerprint(media, 'invariant_matcher_v4', None) is not None
+    assert MediaCache(db_path=db_path).get_fingerprint(media, 'invariant_matcher_v4', None) is None
+
+
+def _file_key(path):
+    st = path.stat()
+    return f"{path}|{st.st_mtime_ns}|{st.st_size}"
+
+
+def test_load_scores_drops_changed_files_and_caps(tmp_path):
+    ref, remux, gone = tmp_path / "ref.mkv", tmp_path / "remux.mkv", tmp_path / "gone.mkv"
+    for path in (ref, remux, gone):
+        path.write_bytes(b"data")
+    live = (_file_key(ref), _file_key(remux), 'mfcc', '')
+    dead = (_file_key(gone), _file_key(remux), 'mfcc', '')
+    score_file = tmp_path / "scores.pkl"
+    writer = MediaCache()
+    writer.set_scores({live: (0.9, 'live'), dead: (0.5, 'dead')})
+    writer.save_scores(score_file)
+    gone.unlink()
+
+    reader = MediaCache()
+    reader.load_scores(score_file)
+    assert reader.get_score(*live) == (0.9, 'live')
+    assert reader.get_score(*dead) is None
+
+    capped = MediaCache(max_scores=2)
+    for n in range(3):
+        capped.set_score(live[0], live[1], f'mode{n}', '', (n, ''))
+    assert capped.get_score(live[0], live[1], 'mode0', '') is None
+    assert capped.get_score(live[0], live[1], 'mode2', '') == (2, '')
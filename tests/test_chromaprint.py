@@ -0,0 +1,18 @@
+import numpy as np
+
+from core.cache import MediaCache
+from matchers.audio.chromaprint import INDEX_MIN_REFS, INDEX_TOP_K, ChromaprintMatcher
+
+
+def test_indexed_compare_marks_unshortlisted_refs_unscored(tmp_path):
+    matcher = ChromaprintMatcher(MediaCache(), {}, tmp_path)
+    rng = np.random.default_rng(0)
+    refs = [rng.integers(0, 2**32, 200, dtype=np.uint32) for _ in range(INDEX_MIN_REFS + 4)]
+    remux = refs[3].copy()
+
+    scores = matcher.compare_stacked(matcher.stack_fingerprints(refs), matcher.stack_fingerprints([remux]))[:, 0]
+
+    assert scores[3] == 1.0
+    # Only the shortlist is scored; the rest must never be assignable
+    assert (scores >= 0).sum() <= INDEX_TOP_K
+    assert (scores[scores < 0] == -1.0).all()
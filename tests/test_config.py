@@ -0,0 +1,17 @@
+import pickle
+import threading
+
+from utils.config import Config
+
+
+def test_config_pickle_round_trip(tmp_path):
+    config = Config(str(tmp_path / "settings.json"))
+    config.save({'match_workers': 2, 'confidence': 80})
+
+    restored = pickle.loads(pickle.dumps(config))
+
+    assert restored.get('match_workers') == 2
+    assert restored.get('confidence') == 80
+    assert restored.load() == config.load()
+    assert isinstance(restored._lock, type(threading.Lock()))
+    assert restored._lock is not config._lock
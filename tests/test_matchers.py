@@ -0,0 +1,19 @@
+import importlib
+
+import pytest
+
+from core.cache import MediaCache
+from core.pipeline import _MATCHER_REGISTRY
+
+
+@pytest.mark.parametrize('mode', sorted(_MATCHER_REGISTRY))
+def test_matchers_have_no_instance_dict(mode, tmp_path):
+    module_path, class_name = _MATCHER_REGISTRY[mode]
+    try:
+        cls = getattr(importlib.import_module(module_path), class_name)
+    except ImportError as e:
+        pytest.skip(f"{module_path}: {e}")
+    matcher = cls(MediaCache(), {}, tmp_path)
+    matcher.stop()
+    matcher.start()
+    assert not hasattr(matcher, '__dict__')
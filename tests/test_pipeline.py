@@ -0,0 +1,26 @@
+import threading
+
+from core.cache import MediaCache
+from core.pipeline import MatchingPipeline
+from utils.config import Config
+
+
+def test_compare_pool_released_after_run(tmp_path):
+    config = Config(str(tmp_path / "settings.json"))
+    config.save({'match_workers': 1})
+    pipeline = MatchingPipeline(MediaCache(db_path=tmp_path / "cache.db"), config, tmp_path)
+    pipeline.set_mode('not_a_mode')
+
+    events = list(pipeline.match([tmp_path / "a.mkv"], [tmp_path / "b.mkv"]))
+
+    assert events[-1]['message'] == 'Invalid matcher mode'
+    assert pipeline._pool is None
+    assert not any(t.name.startswith("compare") for t in threading.enumerate())
+
+
+def test_cascade_scores_are_memoised_per_threshold(tmp_path):
+    from matchers.audio.cascade import CascadeMatcher
+
+    loose = CascadeMatcher(MediaCache(), {'cascade_min_similarity': 0.3}, tmp_path)
+    strict = CascadeMatcher(MediaCache(), {'cascade_min_similarity': 0.7}, tmp_path)
+    assert loose.score_key != strict.score_key
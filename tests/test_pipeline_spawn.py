@@ -0,0 +1,32 @@
+from core.cache import MediaCache
+from core.pipeline import MatchConfig, MatchingPipeline
+from utils.config import Config
+
+
+def test_fingerprints_through_spawn_workers(tmp_path):
+    config = Config(str(tmp_path / "settings.json"))
+    config.save({'match_workers': 2})
+    cache = MediaCache(db_path=tmp_path / "cache.db")
+    pipeline = MatchingPipeline(cache, config, tmp_path)
+    pipeline.set_mode('peak_matcher')
+
+    paths = []
+    for name in ("a.mkv", "b.mkv", "c.mkv"):
+        path = tmp_path / name
+        path.write_bytes(b"not a video")
+        paths.append(path)
+    jobs = [(i == 0, i, path) for i, path in enumerate(paths)]
+
+    pipeline._running = True
+    pipeline._matcher = pipeline._get_matcher()
+    pools = []
+    results = []
+    for result in pipeline._extract_fingerprints(jobs, MatchConfig(mode='peak_matcher')):
+        pools.append(pipeline._process_pool)
+        results.append(result)
+
+    # Every job comes back from a worker; the files are unreadable, so no fingerprints
+    assert sorted(idx for _, idx, _, _ in results) == [0, 1, 2]
+    assert all(fp is None for _, _, _, fp in results)
+    assert all(pool is not None for pool in pools)
+    assert pipeline._process_pool is None
@@ -6,7 +6,9 @@
 from .media import (
     get_stream_info,
     get_media_duration,
+    probe_media,
     extract_audio_segment,
+    extract_full_audio,
     extract_audio_to_wav,
     extract_frames
 )
@@ -15,7 +17,9 @@ from .config import Config
 __all__ = [
     'get_stream_info',
     'get_media_duration',
+    'probe_media',
     'extract_audio_segment',
+    'extract_full_audio',
     'extract_audio_to_wav',
     'extract_frames',
     'Config'
@@ -3,8 +3,9 @@
 # ===========================================
 
 import json
+import threading
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class Config:
     """Application configuration manager"""
@@ -27,29 +28,71 @@ class Config:
             'correlation_chunks': 10,
             'correlation_chunk_duration': 15,
             'correlation_min_valid': 6,
+            'correlation_use_phat': True,
+            'cascade_min_similarity': 0.5,
+
+            # Parallel compare workers (0 = one per CPU)
+            'match_workers': 0,
 
             # Video settings
             'video_frames': 25,
             'video_hash_size': 16,
+            'scene_max_count_ratio': 3.0,
+            'scene_max_duration_ratio': 1.5,
 
             # Audio settings
             'audio_sample_rate': 48000,
             'audio_duration_tolerance': 5.0
         }
+        # Parsed settings, read from disk once and refreshed by save(); load() re-reads
+        # them if the file's mtime changed (edited by hand or by another instance)
+        self._cached: Optional[Dict[str, Any]] = None
+        self._cached_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled; worker processes get their own on unpickling
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
     def load(self) -> Dict[str, Any]:
-        """Load configuration from file"""
-        if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r') as f:
-                    settings = json.load(f)
-                    return {**self.defaults, **settings}
-            except (json.JSONDecodeError, IOError):
-                pass
-        return self.defaults.copy()
+        """Load configuration, re-reading the file only when it changed since the last read"""
+        if self._cached is not None and self._file_mtime() != self._cached_mtime:
+            with self._lock:
+                self._cached = None
+        return self._settings().copy()
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return self.config_file.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _settings(self) -> Dict[str, Any]:
+        cached = self._cached
+        if cached is not None: return cached
+        with self._lock:
+            if self._cached is None:
+                settings = self.defaults.copy()
+                mtime = self._file_mtime()
+                if mtime is not None:
+                    try:
+                        with open(self.config_file, 'r') as f:
+                            settings = {**self.defaults, **json.load(f)}
+                    except (json.JSONDecodeError, IOError):
+                        pass
+                self._cached, self._cached_mtime = settings, mtime
+            return self._cached
 
     def save(self, settings: Dict[str, Any]):
         """Save configuration to file"""
+        with self._lock:
+            self._cached = {**self.defaults, **settings}
         try:
             to_save = {}
             for key, value in settings.items():
@@ -60,10 +103,14 @@ class Config:
 
             with open(self.config_file, 'w') as f:
                 json.dump(to_save, f, indent=2)
+            self._cached_mtime = self._file_mtime()
         except IOError:
             pass
 
+    def settings(self) -> Dict[str, Any]:
+        """Plain-dict snapshot of the cached settings, for handing to worker processes"""
+        return dict(self._settings())
+
     def get(self, key: str, default: Any = None) -> Any:
-        """Get configuration value"""
-        settings = self.load()
-        return settings.get(key, default)
+        """Get configuration value from the cached settings, without touching the disk"""
+        return self._settings().get(key, default)
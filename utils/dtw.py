@@ -0,0 +1,136 @@
+# ===========================================
+# utils/dtw.py - Banded dynamic time warping
+# ===========================================
+"""
+DTW costs between two 1-D sequences, with librosa's default steps and
+weights (diagonal, horizontal, vertical, all weight 1) and absolute
+difference as the local cost: exact within a Sakoe-Chiba band, or the
+FastDTW multiscale approximation for long sequences.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+def _banded_dtw_python(a, b, w):
+    n, m = a.size, b.size
+    prev = np.full(m + 1, np.inf)
+    cur = np.full(m + 1, np.inf)
+    prev[0] = 0.0
+    for i in range(1, n + 1):
+        cur[:] = np.inf
+        for j in range(max(1, i - w), min(m, i + w) + 1):
+            cur[j] = abs(a[i - 1] - b[j - 1]) + min(prev[j - 1], prev[j], cur[j - 1])
+        prev, cur = cur, prev
+    return prev[m]
+
+def _window_dtw_python(a, b, lo, hi):
+    """
+    Accumulated costs of only the cells lo[i] <= j <= hi[i] of each row i,
+    stored row after row from starts[i]; returns (costs, starts)
+    """
+    n = a.size
+    starts = np.zeros(n + 1, np.int64)
+    for i in range(n):
+        starts[i + 1] = starts[i] + hi[i] - lo[i] + 1
+    D = np.full(starts[n], np.inf)
+    for i in range(n):
+        for j in range(lo[i], hi[i] + 1):
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = np.inf
+                if i > 0 and lo[i - 1] <= j - 1 <= hi[i - 1]: best = D[starts[i - 1] + j - 1 - lo[i - 1]]
+                if i > 0 and lo[i - 1] <= j <= hi[i - 1]: best = min(best, D[starts[i - 1] + j - lo[i - 1]])
+                if j > lo[i]: best = min(best, D[starts[i] + j - 1 - lo[i]])
+            D[starts[i] + j - lo[i]] = abs(a[i] - b[j]) + best
+    return D, starts
+
+def _cell(D, starts, lo, hi, i, j):
+    if i < 0 or j < lo[i] or j > hi[i]: return np.inf
+    return D[starts[i] + j - lo[i]]
+
+def _backtrack_python(D, starts, lo, hi):
+    """Warping path (row, column) pairs from (0, 0) to the end cell"""
+    i, j = lo.size - 1, hi[-1]
+    rows = np.empty(i + j + 1, np.int64)
+    cols = np.empty(i + j + 1, np.int64)
+    k = 0
+    while True:
+        rows[k], cols[k] = i, j
+        k += 1
+        if i == 0 and j == 0: break
+        diag = _cell(D, starts, lo, hi, i - 1, j - 1)
+        up = _cell(D, starts, lo, hi, i - 1, j)
+        left = _cell(D, starts, lo, hi, i, j - 1)
+        if diag <= up and diag <= left: i, j = i - 1, j - 1
+        elif up <= left: i -= 1
+        else: j -= 1
+    return rows[:k][::-1], cols[:k][::-1]
+
+if HAVE_NUMBA:
+    _banded_dtw_numba = njit(cache=True, boundscheck=False)(_banded_dtw_python)
+    _window_dtw_numba = njit(cache=True, boundscheck=False)(_window_dtw_python)
+    _cell = njit(inline='always')(_cell)
+    _backtrack_numba = njit(cache=True, boundscheck=False)(_backtrack_python)
+
+def _as_vector(x) -> np.ndarray:
+    """Contiguous float32 or float64 vector, without a copy when it already is one; costs accumulate in float64"""
+    x = np.ascontiguousarray(x)
+    return x if x.dtype in (np.float32, np.float64) else x.astype(np.float64)
+
+def banded_dtw(a: np.ndarray, b: np.ndarray, w: int) -> float:
+    """Accumulated cost at the end cell; inf when |len(a) - len(b)| > w puts it outside the band"""
+    a, b = _as_vector(a), _as_vector(b)
+    if a.size == 0 or b.size == 0: return float('inf')
+    if a.dtype != b.dtype: a, b = a.astype(np.float64), b.astype(np.float64)
+    dtw = _banded_dtw_numba if HAVE_NUMBA else _banded_dtw_python
+    return float(dtw(a, b, int(w)))
+
+def _coarsen(x: np.ndarray) -> np.ndarray:
+    """Mean of each adjacent pair; an odd last element is carried over"""
+    half = (x[:-1:2] + x[1::2]) / 2
+    return np.append(half, x[-1]) if x.size % 2 else half
+
+def _fast_dtw(a, b, radius):
+    """(end cost, warping path), solved at half resolution first and refined around that path"""
+    window_dtw = _window_dtw_numba if HAVE_NUMBA else _window_dtw_python
+    backtrack = _backtrack_numba if HAVE_NUMBA else _backtrack_python
+    n, m = a.size, b.size
+    if n < radius + 2 or m < radius + 2:
+        lo, hi = np.zeros(n, np.int64), np.full(n, m - 1, np.int64)
+    else:
+        _, (rows, cols) = _fast_dtw(_coarsen(a), _coarsen(b), radius)
+        # Every coarse path cell covers a 2x2 block at full resolution; grow the blocks by
+        # radius and keep each row's leftmost and rightmost allowed column
+        lo = np.full(n, m, np.int64)
+        hi = np.full(n, -1, np.int64)
+        for dr in range(-radius, radius + 2):
+            r = 2 * rows + dr
+            keep = (r >= 0) & (r < n)
+            np.minimum.at(lo, r[keep], 2 * cols[keep] - radius)
+            np.maximum.at(hi, r[keep], 2 * cols[keep] + 1 + radius)
+        lo, hi = np.clip(lo, 0, m - 1), np.clip(hi, 0, m - 1)
+    D, starts = window_dtw(a, b, lo, hi)
+    return D[-1], backtrack(D, starts, lo, hi)
+
+def fast_dtw(a: np.ndarray, b: np.ndarray, radius: int = 4) -> float:
+    """
+    FastDTW cost: solve at half resolution recursively, then refine only
+    within radius cells of the projected path, O(n * radius) instead of the
+    band's O(n * |len(a) - len(b)|) when the lengths differ a lot.
+    """
+    a, b = _as_vector(a), _as_vector(b)
+    if a.size == 0 or b.size == 0: return float('inf')
+    cost, _ = _fast_dtw(a, b, int(radius))
+    return float(cost)
+
+if HAVE_NUMBA:
+    # Scene vectors are float32; compile (or load from the on-disk cache) both float
+    # specialisations at import rather than inside the first compare
+    for _dtype in (np.float32, np.float64):
+        _banded_dtw_numba(np.zeros(2, _dtype), np.zeros(2, _dtype), 1)
@@ -0,0 +1,73 @@
+# ===========================================
+# utils/fft.py - FFT backend selection
+# ===========================================
+"""
+Real FFTs through mkl_fft when it is installed, otherwise scipy.fft
+(pocketfft, SIMD-dispatched at runtime, with its own worker threads),
+and the spectrogram helpers built on them.
+"""
+
+import os
+import numpy as np
+import scipy.fft as _scipy_fft
+
+try:
+    import mkl_fft._numpy_fft as _mkl_fft
+    HAVE_MKL_FFT = True
+except ImportError:
+    HAVE_MKL_FFT = False
+
+# The pipeline already runs several compares at once, so one batched FFT gets half the cores
+FFT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# numpy.fft-compatible module, for librosa.set_fftlib
+numpy_fft = _mkl_fft if HAVE_MKL_FFT else _scipy_fft
+
+def next_fast_len(target: int) -> int:
+    return _scipy_fft.next_fast_len(target, real=True)
+
+def rfft(x, n=None, axis=-1):
+    if HAVE_MKL_FFT: return _mkl_fft.rfft(x, n=n, axis=axis)
+    return _scipy_fft.rfft(x, n, axis=axis, workers=FFT_WORKERS)
+
+def irfft(x, n=None, axis=-1, overwrite_x=False, workers: int = FFT_WORKERS):
+    if HAVE_MKL_FFT: return _mkl_fft.irfft(x, n=n, axis=axis)
+    return _scipy_fft.irfft(x, n, axis=axis, overwrite_x=overwrite_x, workers=workers)
+
+def set_workers(workers: int = FFT_WORKERS):
+    """Context manager giving scipy.fft calls inside it (e.g. from librosa) a thread pool"""
+    return _scipy_fft.set_workers(workers)
+
+def use_with_librosa(librosa) -> None:
+    """
+    Points librosa's FFTs at numpy_fft, so repeated same-size STFTs reuse
+    cached plans. librosa < 0.11 defaults to numpy.fft; newer releases
+    already use scipy.fft, and then only MKL needs swapping in.
+    """
+    if librosa.get_fftlib() is not numpy_fft: librosa.set_fftlib(numpy_fft)
+
+def magnitude_spectrogram(audio: np.ndarray, n_fft: int, hop_length: int) -> np.ndarray:
+    """
+    float32 |STFT| as (n_fft // 2 + 1, frames), matching librosa.stft's
+    defaults (centred frames, zero padding, periodic Hann window) but with
+    every frame in one batched rfft.
+    """
+    audio = np.pad(np.asarray(audio, dtype=np.float32), n_fft // 2)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[::hop_length]
+    frames = frames * _hann(n_fft)
+    spectra = rfft(frames, axis=1)
+    return np.abs(spectra, out=np.empty(spectra.shape, dtype=np.float32)).T
+
+def _hann(n: int) -> np.ndarray:
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)).astype(np.float32)
+
+def spectrogram_median(spectrogram: np.ndarray) -> float:
+    """
+    Exact median of all bins. np.median partitions around both middle
+    elements, several times slower than one partition plus a max over the
+    lower half.
+    """
+    flat = spectrogram.ravel()
+    k = flat.size // 2
+    part = np.partition(flat, k)
+    return float(part[k] if flat.size % 2 else (part[:k].max() + part[k]) / 2)
@@ -3,12 +3,26 @@
 # ===========================================
 
 import subprocess
+import functools
+import hashlib
 import json
+import os
+import threading
 import numpy as np
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 import tempfile
 
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    HAVE_ORJSON = False
+
+def _json_loads(data: bytes):
+    """Parses ffprobe's JSON bytes; orjson skips the UTF-8 decode and is several times faster"""
+    return orjson.loads(data) if HAVE_ORJSON else json.loads(data)
+
 def get_stream_info(file_path: Path) -> List[Dict]:
     """Get all stream information from media file"""
     try:
@@ -16,11 +30,11 @@ def get_stream_info(file_path: Path) -> List[Dict]:
             'ffprobe', '-v', 'quiet', '-print_format', 'json',
             '-show_streams', str(file_path)
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+        result = subprocess.run(cmd, capture_output=True, timeout=15)
         if result.returncode == 0:
-            info = json.loads(result.stdout)
+            info = _json_loads(result.stdout)
             return info.get('streams', [])
-    except (subprocess.TimeoutExpired, json.JSONDecodeError, FileNotFoundError):
+    except (subprocess.TimeoutExpired, ValueError, FileNotFoundError):
         return []
     return []
 
@@ -28,22 +42,73 @@ def get_media_duration(file_path: Path) -> Optional[float]:
     """Get media file duration in seconds"""
     try:
         cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', str(file_path)]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        result = subprocess.run(cmd, capture_output=True, timeout=10)
         if result.returncode == 0:
-            info = json.loads(result.stdout)
+            info = _json_loads(result.stdout)
             duration = float(info.get('format', {}).get('duration', 0))
             return duration if duration > 0 else None
-    except (subprocess.TimeoutExpired, json.JSONDecodeError, FileNotFoundError):
+    except (subprocess.TimeoutExpired, ValueError, FileNotFoundError):
         return None
     return None
 
+def probe_media(file_path: Path) -> Tuple[List[Dict], Optional[float]]:
+    """Streams and duration from one ffprobe run, for callers that need both"""
+    try:
+        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', '-show_format', str(file_path)]
+        result = subprocess.run(cmd, capture_output=True, timeout=15)
+        if result.returncode == 0:
+            info = _json_loads(result.stdout)
+            duration = float(info.get('format', {}).get('duration', 0))
+            return info.get('streams', []), duration if duration > 0 else None
+    except (subprocess.TimeoutExpired, ValueError, FileNotFoundError):
+        pass
+    return [], None
+
+def _read_stdout_into(cmd: List[str], out: np.ndarray, timeout: float) -> Optional[int]:
+    """
+    Runs cmd with its stdout read straight into out's buffer, skipping the
+    chunk list and join that capture_output builds. Returns the bytes read,
+    or None if the command failed or ran past timeout; output beyond out is
+    drained and dropped.
+    """
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, bufsize=0)
+    except FileNotFoundError:
+        return None
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        view = memoryview(out).cast('B')
+        filled = 0
+        while filled < len(view):
+            n = process.stdout.readinto(view[filled:])
+            if not n: break
+            filled += n
+        while process.stdout.read(1 << 16): pass
+        returncode = process.wait()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+    if timed_out.is_set() or returncode != 0: return None
+    return filled
+
 def extract_audio_segment(file_path: Path, stream_index: int, sample_rate: int,
                       start_time: float = 0, duration_limit: Optional[float] = None) -> Optional[np.ndarray]:
-    """Extract audio segment as numpy array"""
+    """Extract audio segment as a float32 numpy array, piped from ffmpeg with no temp file"""
     try:
         cmd = [
             'ffmpeg', '-nostdin', '-v', 'error',
+            # Callers decode many files in parallel; extra threads per process only oversubscribe
+            '-threads', '1',
             '-ss', str(start_time),
+            # Input-side limit: ffmpeg ignores options after the last output, so a
+            # trailing -t used to decode (and buffer) the whole rest of the file
+            *(['-t', str(duration_limit)] if duration_limit else []),
             '-i', str(file_path),
             # --- CORRECTION: Use absolute stream index ---
             '-map', f'0:{stream_index}',
@@ -53,7 +118,10 @@ def extract_audio_segment(file_path: Path, stream_index: int, sample_rate: int,
             '-'
         ]
         if duration_limit:
-            cmd.extend(['-t', str(duration_limit)])
+            # Known length: decode straight into the array (one second of slack for resampler tails)
+            audio = np.empty(int((duration_limit + 1) * sample_rate), dtype=np.float32)
+            filled = _read_stdout_into(cmd, audio, timeout=60)
+            return audio[:filled // audio.itemsize] if filled else None
         result = subprocess.run(cmd, capture_output=True, timeout=60)
         if result.returncode == 0 and result.stdout:
             audio = np.frombuffer(result.stdout, dtype=np.float32)
@@ -62,6 +130,16 @@ def extract_audio_segment(file_path: Path, stream_index: int, sample_rate: int,
         pass
     return None
 
+def extract_full_audio(file_path: Path, stream_index: int, sample_rate: int,
+                       duration: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    Whole stream as float32 in one ffmpeg run, for callers that slice it in
+    memory. A known (probed) duration, plus a second for streams running past
+    the container's, lets the samples stream into one preallocated array.
+    """
+    return extract_audio_segment(file_path, stream_index, sample_rate,
+                                 duration_limit=duration + 1 if duration else None)
+
 def extract_audio_to_wav(file_path: Path, stream_index: int, output_path: Path,
                          sample_rate: int = 22050) -> bool:
     """Extract audio stream to WAV file"""
@@ -80,23 +158,71 @@ def extract_audio_to_wav(file_path: Path, stream_index: int, output_path: Path,
     except (subprocess.TimeoutExpired, FileNotFoundError):
         return False
 
+def get_or_extract_wav(file_path: Path, stream_index: int, sample_rate: int, cache_dir: Path) -> Optional[Path]:
+    """
+    WAV of one stream under cache_dir, extracted on first request only. Named
+    by file identity (path, mtime, size), stream and rate, so every caller
+    asking for the same audio gets the same file.
+    """
+    try:
+        st = file_path.stat()
+    except OSError:
+        return None
+    key = hashlib.blake2b(f"{file_path.resolve()}|{st.st_mtime_ns}|{st.st_size}|{stream_index}|{sample_rate}".encode(), digest_size=8).hexdigest()
+    wav_path = cache_dir / f"{file_path.stem}_{key}.wav"
+    if wav_path.exists(): return wav_path
+    # Extract under a private name and rename, so a concurrent caller never reads a partial file
+    part_path = cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.wav"
+    if not extract_audio_to_wav(file_path, stream_index, part_path, sample_rate): return None
+    os.replace(part_path, wav_path)
+    return wav_path
+
+@functools.lru_cache(maxsize=1024)
+def _video_dimensions(file_path: str, mtime_ns: int, size: int) -> Optional[Tuple[int, int]]:
+    """(width, height) of the first video stream; mtime and size in the key drop stale entries"""
+    try:
+        probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'csv=s=x:p=0', file_path]
+        probe_result = subprocess.run(probe_cmd, capture_output=True, timeout=5)
+        if probe_result.returncode != 0: return None
+        # "WxH" as bytes; int() parses ASCII digits in bytes directly
+        dimensions = probe_result.stdout.strip().split(b'x')
+        if len(dimensions) != 2: return None
+        return int(dimensions[0]), int(dimensions[1])
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
+        return None
+
 def extract_frames(file_path: Path, timestamps: List[float]) -> Optional[List[np.ndarray]]:
-    """Extract video frames at specified timestamps"""
-    frames = []
+    """Extract video frames at specified timestamps, all in one ffmpeg run"""
+    if len(timestamps) == 0: return None
+    try:
+        st = file_path.stat()
+    except OSError:
+        return None
+    dimensions = _video_dimensions(str(file_path), st.st_mtime_ns, st.st_size)
+    if dimensions is None: return None
+    width, height = dimensions
+
+    # Every timestamp is its own input with a fast input-side seek; a concat
+    # filter strings their first frames into one rawvideo stream
+    n = len(timestamps)
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error']
+    for ts in timestamps:
+        cmd.extend(['-ss', str(ts), '-i', str(file_path)])
+    graph = ''.join(f'[{k}:v:0]trim=end_frame=1[v{k}];' for k in range(n))
+    graph += ''.join(f'[v{k}]' for k in range(n)) + f'concat=n={n}:v=1:a=0[out]'
+    cmd.extend(['-filter_complex', graph, '-map', '[out]', '-vsync', 'passthrough',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'])
+    # Frames stream straight into one preallocated (n, h, w, 3) stack
+    stack = np.empty((n, height, width, 3), dtype=np.uint8)
+    filled = _read_stdout_into(cmd, stack, timeout=10 * n)
+    if filled is not None and filled >= stack[0].nbytes:
+        return list(stack[:filled // stack[0].nbytes])
+
+    # One seek per process, for files the combined graph cannot handle; each frame
+    # is read into the next free slot of the same stack
+    count = 0
     for ts in timestamps:
-        try:
-            probe_cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'csv=s=x:p=0', str(file_path)]
-            probe_result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=5)
-            if probe_result.returncode != 0: continue
-            dimensions = probe_result.stdout.strip().split('x')
-            if len(dimensions) != 2: continue
-            width, height = int(dimensions[0]), int(dimensions[1])
-            cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-ss', str(ts), '-i', str(file_path), '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'rawvideo', '-pix_fmt', 'rgb24', '-']
-            result = subprocess.run(cmd, capture_output=True, timeout=10)
-            if result.returncode == 0 and result.stdout:
-                frame = np.frombuffer(result.stdout, dtype=np.uint8)
-                frame = frame.reshape((height, width, 3))
-                frames.append(frame)
-        except (subprocess.TimeoutExpired, ValueError):
-            continue
-    return frames if frames else None
+        cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-ss', str(ts), '-i', str(file_path), '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        if _read_stdout_into(cmd, stack[count], timeout=10) == stack[count].nbytes:
+            count += 1
+    return list(stack[:count]) if count else None